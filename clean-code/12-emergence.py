@@ -4,7 +4,25 @@
 #   {{{2
 import sys
 import os
+import re
 import tempfile
+import io
+import mmap
+import array
+import itertools
+import locale
+import multiprocessing
+import struct
+import threading
+import time
+import queue
+import gzip
+import bz2
+import lzma
+import asyncio
+import concurrent.futures
+import hashlib
+import collections.abc
 
 #   Four rules for a simple design:
 #       1)  Runs all tests
@@ -34,36 +52,507 @@ import tempfile
 #   {{{
 #   Interface class:
 class TableReaderInterface():
-    def read(self, path):
-        f = self.openFile(path)
-        buffer = self.readFile(f)
-        raw_table = self.extractTable(buffer)
-        table = self.parseTable(raw_table)
+    def read(self, path, columns=None, where=None):
+        with self.openFile(path) as f:
+            buffer = self.readFile(f)
+            if columns is None and where is None:
+                raw_table = self.extractTable(buffer)
+            else:
+                raw_table = self.extractRows(buffer, columns, where)
+            table = self.parseTable(raw_table)
         return table 
+    def iter_rows(self, path):
+        with self.openFile(path) as f:
+            for chunk in self.readLines(f):
+                for row in self.extractTable(chunk):
+                    yield self.parseRow(row)
     def openFile(self, path):
         raise NotImplementedError()
     def readFile(self, f):
         raise NotImplementedError()
+    def readLines(self, f):
+        return iter(f)
     def extractTable(self, buffer):
         raise NotImplementedError()
+    def extractRows(self, buffer, columns, where):
+        #   'extractTable()' keeping only the 'columns' (indexes) of each row, and the rows for which 'where(row)' (given those raw fields) is true
+        rows = self.extractTable(buffer)
+        if columns is not None:
+            rows = ( _select(row, columns) for row in rows )
+        if where is not None:
+            rows = ( row for row in rows if where(row) )
+        return list(rows)
+    def parseCell(self, cell):
+        try:
+            return float(cell)
+        except ValueError:
+            return cell
+    def parseRow(self, row):
+        return [ self.parseCell(cell) for cell in row ]
     def parseTable(self, data):
-        def parse_cell(cell):
+        return [ self.parseRow(row) for row in data ]
+    def read_columns(self, path, sample=100):
+        with self.openFile(path) as f:
+            buffer = self.readFile(f)
+            raw_table = self.extractTable(buffer)
+            columns = self.parseColumns(raw_table, sample)
+        return columns
+    def parseColumns(self, data, sample=100):
+        if len(data) == 0:
+            return dict()
+        header = list(data[0])
+        for (i, row) in enumerate(data):
+            if len(row) != len(header):
+                raise ValueError("row %d has %d fields, header has %d" % (i, len(row), len(header)))
+        columns = dict()
+        for (j, name) in enumerate(header):
+            values = [ row[j] for row in data[1:] ]
+            if len(values) == 0 or not all( self.isNumber(v) for v in values[:sample] ):
+                columns[name] = values
+                continue
             try:
-                return float(cell)
+                columns[name] = array.array('d', map(float, values))
             except ValueError:
-                return cell
-        return [ [ parse_cell(cell) for cell in row ] for row in data ]
+                i = next( i for (i, v) in enumerate(values) if not self.isNumber(v) )
+                raise ValueError("row %d, column %r: %r is not a number" % (i + 1, name, values[i])) from None
+        return columns
+    def isNumber(self, cell):
+        try:
+            float(cell)
+            return True
+        except ValueError:
+            return False
 
 #   Implementation:
 class CSVReader(TableReaderInterface):
+    INDEX_SUFFIX = '.idx'
     def openFile(self, path):
-        return open(path, 'rt')
+        codec = _compression(path)
+        if codec is None:
+            return open(path, 'rt')
+        return io.TextIOWrapper(io.BufferedReader(_BackgroundReader(codec.open(path, 'rb'))))
     def readFile(self, f):
         return f.read()
     def extractTable(self, buffer):
         row_delim = ','
         line_delim = '\n'
         return [ l.split(row_delim) for l in buffer.split(line_delim) if len(l) > 0 ]
+    def extractRows(self, buffer, columns, where):
+        #   Each line is split only as far as the last selected column
+        maxsplit = _maxsplit(columns)
+        rows = []
+        for l in buffer.split('\n'):
+            if len(l) == 0:
+                continue
+            row = l.split(',', maxsplit)
+            if columns is not None:
+                row = _select(row, columns)
+            if where is None or where(row):
+                rows.append(row)
+        return rows
+    def read_parallel(self, path, processes=None, min_chunk=1<<20):
+        size = os.path.getsize(path)
+        processes = processes or os.cpu_count() or 1
+        if processes == 1 or size <= min_chunk or _compression(path) is not None:
+            return self.read(path)
+        chunks = max(1, min(processes * 4, size // max(min_chunk, 1)))
+        bounds = self.chunkBoundaries(path, size, chunks)
+        with multiprocessing.Pool(processes) as pool:
+            tables = pool.map(_read_csv_chunk, [ (self, path, start, end) for (start, end) in zip(bounds, bounds[1:]) ])
+        return list(itertools.chain.from_iterable(tables))
+    def chunkBoundaries(self, path, size, chunks):
+        #   Byte offsets splitting the file into 'chunks' ranges, each moved forward to just past a newline
+        bounds = [ 0 ]
+        with open(path, 'rb') as f:
+            for i in range(1, chunks):
+                f.seek(max(size * i // chunks, bounds[-1]))
+                f.readline()
+                if bounds[-1] < f.tell() < size:
+                    bounds.append(f.tell())
+        bounds.append(size)
+        return bounds
+    def read_rows(self, path, start, stop):
+        with self.rowIndex(path) as index:
+            (count,) = struct.unpack_from('<Q', index, _ROW_INDEX_HEADER.size - 8)
+            start, stop, _ = slice(start, stop).indices(count)
+            if start >= stop:
+                return []
+            begin, end = [ struct.unpack_from('<Q', index, _ROW_INDEX_HEADER.size + 8 * i)[0] for i in (start, stop) ]
+        with open(path, 'rb') as f:
+            f.seek(begin)
+            buffer = self.decodeChunk(f.read(end - begin))
+        return self.parseTable(self.extractTable(buffer))
+    def rowIndex(self, path):
+        #   The mapped index, rebuilt first if it is missing, or the file's size/mtime have changed
+        if _compression(path) is not None:
+            raise ValueError("path=(%s) is compressed, rows can't be read by offset" % path)
+        stat = os.stat(path)
+        index_path = path + self.INDEX_SUFFIX
+        try:
+            with open(index_path, 'rb') as f:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if _ROW_INDEX_HEADER.unpack_from(index)[:3] == (_ROW_INDEX_MAGIC, stat.st_size, stat.st_mtime_ns):
+                return index
+            index.close()
+        except (OSError, ValueError, struct.error):
+            pass
+        self.buildRowIndex(path, index_path, stat)
+        with open(index_path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    def buildRowIndex(self, path, index_path, stat):
+        #   The offset of each row of 'read()', and the size of the file
+        with open(path, 'rb') as f:
+            offsets = array.array('Q', self.rowOffsets(f))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        with open(index_path + '.tmp', 'wb') as f:
+            f.write(_ROW_INDEX_HEADER.pack(_ROW_INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(offsets) - 1))
+            f.write(offsets.tobytes())
+        os.replace(index_path + '.tmp', index_path)
+    def rowOffsets(self, f):
+        #   The offset of each non-empty line of the (binary) file 'f', then its size
+        pos = 0
+        for line in _universal_lines(f):
+            if len(line.rstrip(b'\r\n')) > 0:
+                yield pos
+            pos += len(line)
+        yield pos
+    def decodeChunk(self, data):
+        #   As 'open(path, 'rt')' would (universal newlines)
+        return data.decode(locale.getpreferredencoding(False)).replace('\r\n', '\n').replace('\r', '\n')
+
+class RFC4180Reader(CSVReader):
+    #   'extractTable()' emits parsed rows, so parsing is done (and 'parseRow()' does nothing more)
+    #   (its row index is of records, which differ from lines where a quoted field has a line break, so it is kept separately)
+    INDEX_SUFFIX = '.records.idx'
+    def extractTable(self, buffer):
+        return self.extractRows(buffer, None, None)
+    def extractRows(self, buffer, columns, where):
+        parse = self.parseCell
+        maxsplit = _maxsplit(columns)
+        rows = []
+        pos, size = 0, len(buffer)
+        while pos < size:
+            newline = buffer.find('\n', pos)
+            if newline == -1:
+                newline = size
+            line = buffer[pos:newline]
+            if '"' in line:
+                row, quoted, pos = self.extractRecord(buffer, pos)
+            elif len(line) > 0:
+                row, quoted, pos = line.split(',', maxsplit), None, newline + 1
+            else:
+                pos = newline + 1
+                continue
+            if columns is not None:
+                row = _select(row, columns)
+                quoted = None if quoted is None else _select(quoted, columns, False)
+            if where is not None and not where(row):
+                continue
+            if quoted is None:
+                rows.append([ parse(cell) for cell in row ])
+            else:
+                rows.append([ cell if q else parse(cell) for (cell, q) in zip(row, quoted) ])
+        return rows
+    def extractRecord(self, buffer, pos):
+        #   The raw fields of the record starting at 'pos', whether each was quoted, and the position after it
+        #   States: at the start of a field, in an unquoted field, in a quoted field, just after a quote in a quoted field
+        START, UNQUOTED, QUOTED, QUOTE = range(4)
+        row, quoted, field, state = [], [], [], START
+        def emit():
+            row.append(''.join(field))
+            quoted.append(state in (QUOTED, QUOTE))
+            field.clear()
+        size = len(buffer)
+        while pos < size:
+            c = buffer[pos]
+            if state == QUOTED:
+                end = buffer.find('"', pos)
+                if end == -1:
+                    raise ValueError("unterminated quoted field")
+                field.append(buffer[pos:end])
+                pos, state = end + 1, QUOTE
+                continue
+            if state == QUOTE and c == '"':
+                field.append('"')
+                state = QUOTED
+            elif c == ',':
+                emit()
+                state = START
+            elif c == '\n':
+                emit()
+                return row, quoted, pos + 1
+            elif state == START and c == '"':
+                state = QUOTED
+            elif state == QUOTE:
+                raise ValueError("unexpected %r after closing quote" % c)
+            else:
+                field.append(c)
+                state = UNQUOTED
+            pos += 1
+        if state == QUOTED:
+            raise ValueError("unterminated quoted field")
+        emit()
+        return row, quoted, pos
+    def chunkBoundaries(self, path, size, chunks):
+        #   As 'CSVReader', but each boundary is the start of a record (a newline may be inside a quoted field),
+        #   so the records are walked from the start of the file to find them
+        bounds = [ 0 ]
+        with open(path, 'rb') as f:
+            for offset in self.rowOffsets(f):
+                if size * len(bounds) // chunks <= offset < size and offset > bounds[-1]:
+                    bounds.append(offset)
+        bounds.append(size)
+        return bounds
+    def rowOffsets(self, f):
+        #   The offset of each non-empty record, joining lines until their quotes are balanced (as 'readLines()'), then the size
+        start, pos, quotes, empty = 0, 0, 0, True
+        for line in _universal_lines(f):
+            quotes += line.count(b'"')
+            empty = empty and len(line.rstrip(b'\r\n')) == 0
+            pos += len(line)
+            if quotes % 2 == 0:
+                if not empty:
+                    yield start
+                start, quotes, empty = pos, 0, True
+        if not empty:
+            yield start
+        yield pos
+    def readLines(self, f):
+        #   Join lines until their quotes are balanced, so a record with a quoted newline is read whole
+        record = ''
+        for line in f:
+            record += line
+            if record.count('"') % 2 == 0:
+                yield record
+                record = ''
+        if len(record) > 0:
+            yield record
+    def parseRow(self, row):
+        return row
+
+class CachedCSVReader(CSVReader):
+    #   Cache file: a header, the length of each row, then for each column a float64 array and a uint32 array of codes
+    #   (0 for the float, k for the k-th string of the string dictionary, 0xFFFFFFFF past the end of a short row), then the strings
+    MISSING = 0xFFFFFFFF
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+    def read(self, path, columns=None, where=None):
+        #   ('where' is given raw fields, which the cache no longer has, so a 'where' selection is read from the file,
+        #   while 'columns' alone are read from just those columns of the cache)
+        if where is not None:
+            return super().read(path, columns, where)
+        stat = os.stat(path)
+        cache_path = self.cachePath(path)
+        table = self.readCache(cache_path, stat, columns)
+        if table is None:
+            table = super().read(path)
+            try:
+                self.writeCache(cache_path, stat, table)
+            except OSError:
+                pass
+            if columns is not None:
+                missing = self.parseCell('')
+                table = [ _select(row, columns, missing) for row in table ]
+        return table
+    def cachePath(self, path):
+        if self.cache_dir is None:
+            return path + '.cache'
+        return os.path.join(self.cache_dir, hashlib.sha1(os.path.abspath(path).encode()).hexdigest() + '.cache')
+    def writeCache(self, cache_path, stat, table):
+        ncols = max( (len(row) for row in table), default=0 )
+        strings = dict()
+        lengths = array.array('I', [ len(row) for row in table ])
+        columns = []
+        for j in range(ncols):
+            values = array.array('d', bytes(8 * len(table)))
+            codes = array.array('I', bytes(4 * len(table)))
+            for (i, row) in enumerate(table):
+                if j >= len(row):
+                    codes[i] = self.MISSING
+                elif isinstance(row[j], str):
+                    codes[i] = strings.setdefault(row[j], len(strings) + 1)
+                else:
+                    values[i] = row[j]
+            columns += [ values, codes ]
+        blobs = [ string.encode('utf-8') for string in strings ]
+        offsets = array.array('Q', itertools.accumulate(map(len, blobs), initial=0))
+        sections = [ lengths ] + columns + [ offsets ]
+        if sys.byteorder != 'little':
+            for section in sections:
+                section.byteswap()
+        with open(cache_path + '.tmp', 'wb') as f:
+            f.write(_CACHE_HEADER.pack(_CACHE_MAGIC, stat.st_size, stat.st_mtime_ns, len(table), ncols, len(blobs)))
+            for section in sections:
+                f.write(section.tobytes())
+                f.write(bytes(-len(section.tobytes()) % 8))
+            f.write(b''.join(blobs))
+        os.replace(cache_path + '.tmp', cache_path)
+    def readCache(self, cache_path, stat, columns=None):
+        #   The cached table, or None if there is no cache (or it is for a different version of the file, or is truncated/corrupt)
+        #   Given 'columns', only those sections are read (all of them if negative indexes are used, as short rows end in different columns)
+        try:
+            with open(cache_path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            with buffer:
+                magic, size, mtime_ns, nrows, ncols, nstrings = _CACHE_HEADER.unpack_from(buffer)
+                if (magic, size, mtime_ns) != (_CACHE_MAGIC, stat.st_size, stat.st_mtime_ns) or sys.byteorder != 'little':
+                    return None
+                pos = _CACHE_HEADER.size
+                def section(typecode, n, itemsize):
+                    #   Each section is copied out of the mapping whole
+                    nonlocal pos
+                    with memoryview(buffer)[pos:pos + n * itemsize] as data:
+                        if len(data) != n * itemsize:
+                            raise ValueError("cache section at %d is truncated" % pos)
+                        values = data.cast(typecode).tolist()
+                    pos += -(-n * itemsize // 8) * 8
+                    return values
+                wanted = range(ncols) if columns is None or any( i < 0 for i in columns ) else set(columns)
+                lengths = section('I', nrows, 4)
+                sections = dict()
+                for j in range(ncols):
+                    if j in wanted:
+                        sections[j] = (section('d', nrows, 8), section('I', nrows, 4))
+                    else:
+                        pos += -(-nrows * 8 // 8) * 8 + -(-nrows * 4 // 8) * 8
+                offsets = section('Q', nstrings + 1, 8)
+                blob = buffer[pos:pos + offsets[-1]]
+                if len(blob) != offsets[-1]:
+                    raise ValueError("cache strings at %d are truncated" % pos)
+            strings = [ None ] + [ blob[start:end].decode('utf-8') for (start, end) in zip(offsets, offsets[1:]) ]
+        except (struct.error, ValueError, TypeError):
+            return None
+        #   Strings are looked up only in the columns that have them
+        cells = dict()
+        for (j, (values, codes)) in sections.items():
+            if any(codes):
+                values = [ v if c == 0 else strings[c] if c != self.MISSING else None for (v, c) in zip(values, codes) ]
+            cells[j] = values
+        if columns is not None:
+            #   As '_select()', on the cached columns
+            missing = self.parseCell('')
+            rows = []
+            for (r, n) in enumerate(lengths):
+                row = []
+                for i in columns:
+                    j = i if i >= 0 else n + i
+                    row.append(cells[j][r] if 0 <= j < n else missing)
+                rows.append(row)
+            return rows
+        if ncols == 0:
+            return [ [] for n in lengths ]
+        cells = [ cells[j] for j in range(ncols) ]
+        return [ list(row) if n == ncols else list(row[:n]) for (row, n) in zip(zip(*cells), lengths) ]
+
+_CACHE_MAGIC = b'TBLCACH1'
+_CACHE_HEADER = struct.Struct('<8sQQQQQ')
+
+class AsyncTableReader:
+    #   Wraps any 'TableReaderInterface' (composition, rather than another subclass of each reader)
+    def __init__(self, reader):
+        self.reader = reader
+    async def read_many(self, paths, concurrency=8):
+        #   Yields (path, table) as each file is read, with up to 'concurrency' files being opened/read at once
+        #   If the caller stops early, or a read raises, the remaining reads are cancelled (a read already running in its thread
+        #   is left to finish there, rather than the event loop waiting for it)
+        loop = asyncio.get_running_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+        async def read(path):
+            return path, await loop.run_in_executor(executor, self.reader.read, path)
+        tasks = [ asyncio.ensure_future(read(path)) for path in paths ]
+        try:
+            for result in asyncio.as_completed(tasks):
+                yield await result
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+def _maxsplit(columns):
+    #   The 'maxsplit' for 'str.split()' that separates every field in 'columns' (all of them, if negative indexes are used)
+    if columns is None or any( i < 0 for i in columns ):
+        return -1
+    return max(columns, default=-1) + 1
+
+def _select(row, columns, missing=''):
+    #   The fields 'columns' (indexes) of 'row', with 'missing' for those past the end of a short row
+    return [ row[i] if -len(row) <= i < len(row) else missing for i in columns ]
+
+def _universal_lines(f):
+    #   The lines of the binary file 'f', each ending at a '\n', '\r\n', or lone '\r' (as text mode, and 'decodeChunk()', split them)
+    for line in f:
+        yield from re.findall(rb'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+', line)
+
+def _compression(path):
+    #   The module that decompresses the file, recognised by its magic number (or None)
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    for (prefix, codec) in ((b'\x1f\x8b', gzip), (b'BZh', bz2), (b'\xfd7zXZ\x00', lzma)):
+        if magic.startswith(prefix):
+            return codec
+    return None
+
+class _BackgroundReader(io.RawIOBase):
+    #   Decompresses 'source' on a thread, a chunk at a time, into a queue of at most 'depth' chunks
+    def __init__(self, source, chunk=1<<16, depth=8):
+        self.chunks = queue.Queue(depth)
+        self.pending = memoryview(b'')
+        self.eof = False
+        self.closing = threading.Event()
+        self.thread = threading.Thread(target=self.produce, args=(source, chunk), daemon=True)
+        self.thread.start()
+    def produce(self, source, chunk):
+        try:
+            with source:
+                while not self.closing.is_set():
+                    data = source.read(chunk)
+                    self.put(data)
+                    if len(data) == 0:
+                        return
+        except Exception as e:
+            self.put(e)
+    def put(self, item):
+        while not self.closing.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+    def readable(self):
+        return True
+    def readinto(self, b):
+        if len(self.pending) == 0:
+            if self.eof:
+                return 0
+            item = self.chunks.get()
+            if isinstance(item, Exception):
+                raise item
+            if len(item) == 0:
+                self.eof = True
+                return 0
+            self.pending = memoryview(item)
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+    def close(self):
+        self.closing.set()
+        super().close()
+
+_ROW_INDEX_MAGIC = b'CSVIDX1\0'
+_ROW_INDEX_HEADER = struct.Struct('<8sQQQ')
+
+def _read_csv_chunk(args):
+    reader, path, start, end = args
+    with open(path, 'rb') as f:
+        f.seek(start)
+        buffer = reader.decodeChunk(f.read(end - start))
+    return reader.parseTable(reader.extractTable(buffer))
 
 def test_CSVReader():
     #   {{{
@@ -84,6 +573,402 @@ def test_CSVReader():
     assert data == expected_data
     #   }}}
 test_CSVReader()
+
+#   Streaming rows:
+#   'iter_rows()' is a second template method built from the same steps: 'readLines()' yields the file a piece at a time
+#   (by default, a line at a time), and each piece goes through 'extractTable()' and 'parseRow()' as it is read
+#   Only one piece is held at once, rather than the buffer, the split table, and the parsed table
+#   (any reader whose 'extractTable()' accepts a fragment of the file, such as a line of a CSV, can stream its rows)
+def test_iter_rows():
+    #   {{{
+    test_file_path = None
+    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as f:
+        f.write('Name,Age\nAlice,30\n\nBob,35.5\n')
+        test_file_path = f.name
+    reader = CSVReader()
+    rows = reader.iter_rows(test_file_path)
+    assert next(rows) == ['Name', 'Age']
+    assert list(rows) == [ ['Alice', 30.0], ['Bob', 35.5] ]
+    assert list(reader.iter_rows(test_file_path)) == reader.read(test_file_path)
+    os.remove(test_file_path)
+    #   }}}
+test_iter_rows()
+
+#   Memory-mapped CSV:
+#   'MappedCSVReader' maps the file instead of reading it, and 'view()' only records where each row is in the mapping
+#   (one 'array('Q')' of row bounds for the file), so the table it gives costs a few bytes a row, and an untouched field is never copied:
+#   a 'MappedRow' is made for a row when it is accessed, splitting that row into fields, and decoding a field when it is accessed
+#   'read()' decodes the whole mapping and splits it at once, as 'CSVReader' does
+#   (the mapping is raw bytes, so a '\r\n' or a lone '\r' is taken as a line break, as the text-mode 'CSVReader' does)
+class MappedTable(collections.abc.Sequence):
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.bounds = array.array('Q')
+        for match in re.finditer(rb'[^\r\n]+', buffer):
+            self.bounds.extend(match.span())
+    def __len__(self):
+        return len(self.bounds) // 2
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ self[j] for j in range(*i.indices(len(self))) ]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("row %d out of range" % i)
+        return MappedRow(self.buffer, self.bounds[2 * i], self.bounds[2 * i + 1])
+class MappedRow(collections.abc.Sequence):
+    def __init__(self, buffer, start, end):
+        self.buffer = buffer
+        self.start, self.end = start, end
+        self.fields = None
+    def split(self):
+        #   The raw fields of the row, split on first access
+        if self.fields is None:
+            self.fields = self.buffer[self.start:self.end].split(b',')
+        return self.fields
+    def __len__(self):
+        return len(self.split())
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ field.decode('utf-8') for field in self.split()[i] ]
+        return self.split()[i].decode('utf-8')
+class MappedCSVReader(CSVReader):
+    def view(self, path):
+        #   (the mapping stays open while the table refers to it, anything else is closed once read)
+        f = self.openFile(path)
+        buffer = self.readFile(f)
+        if buffer is not f:
+            f.close()
+        return MappedTable(buffer)
+    def openFile(self, path):
+        #   (a compressed file can't be mapped, it is decompressed as 'CSVReader' does, into bytes)
+        codec = _compression(path)
+        if codec is not None:
+            return io.BufferedReader(_BackgroundReader(codec.open(path, 'rb')))
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return io.BytesIO()
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    def readFile(self, f):
+        return f if isinstance(f, mmap.mmap) else f.read()
+    def readLines(self, f):
+        return iter(f.readline, b'')
+    def decodeChunk(self, data):
+        return data
+    def decodeText(self, buffer):
+        #   The mapping (or a chunk of it) as text, with line breaks made '\n' (as 'CSVReader.decodeChunk()')
+        return bytes(buffer).decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+    def extractTable(self, buffer):
+        return super().extractTable(self.decodeText(buffer))
+    def extractRows(self, buffer, columns, where):
+        return super().extractRows(self.decodeText(buffer), columns, where)
+
+def test_MappedCSVReader():
+    #   {{{
+    test_file_path = None
+    with tempfile.NamedTemporaryFile(mode='wb', delete=False) as f:
+        f.write('Name,Age,City\r\nAlice,30,Zürich\n\nBob,,Paris\nCarol,41.5,'.encode('utf-8'))
+        test_file_path = f.name
+    reader = MappedCSVReader()
+    assert reader.read(test_file_path) == CSVReader().read(test_file_path)
+    assert list(reader.iter_rows(test_file_path)) == CSVReader().read(test_file_path)
+    table = reader.view(test_file_path)
+    assert table[1][2] == 'Zürich' and table[2][1] == '' and table[3][1:] == ['41.5', '']
+    assert len(table) == 4 and list(table[-1]) == ['Carol', '41.5', ''] and len(table[0]) == 3
+    #   A lone '\r' ends a row, as it does for 'CSVReader'
+    with open(test_file_path, 'wb') as f:
+        f.write(b'a,b\rc,d\ne,f\r\n')
+    assert reader.read(test_file_path) == CSVReader().read(test_file_path) == [ ['a', 'b'], ['c', 'd'], ['e', 'f'] ]
+    assert list(reader.iter_rows(test_file_path)) == CSVReader().read(test_file_path)
+    assert [ list(row) for row in reader.view(test_file_path) ] == [ ['a', 'b'], ['c', 'd'], ['e', 'f'] ]
+    os.remove(test_file_path)
+    with tempfile.NamedTemporaryFile(mode='wb', delete=False) as f:
+        test_file_path = f.name
+    assert reader.read(test_file_path) == []
+    os.remove(test_file_path)
+    #   }}}
+test_MappedCSVReader()
+
+#   Columnar tables:
+#   'read_columns()' takes the first row as the column names, and returns a dict of columns
+#   Each column's type is inferred from its first 'sample' values: numeric columns are converted in bulk into 'array('d')',
+#   and other columns are left as lists of str, a ValueError (giving the row) is raised only for a value that doesn't match its column
+def test_read_columns():
+    #   {{{
+    test_file_path = None
+    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as f:
+        f.write('Name,Age,Salary\nAlice,30,75000.5\nBob,35,100000\n')
+        test_file_path = f.name
+    for reader in (CSVReader(), MappedCSVReader()):
+        columns = reader.read_columns(test_file_path)
+        assert columns == { 'Name': ['Alice', 'Bob'], 'Age': array.array('d', [30.0, 35.0]), 'Salary': array.array('d', [75000.5, 100000.0]) }
+    with open(test_file_path, 'a') as f:
+        f.write('Charlie,forty,65000\n')
+    assert CSVReader().read_columns(test_file_path)['Age'] == ['30', '35', 'forty']
+    try:
+        CSVReader().read_columns(test_file_path, sample=2)
+        assert False
+    except ValueError as e:
+        assert 'row 3' in str(e) and 'forty' in str(e)
+    os.remove(test_file_path)
+    #   }}}
+test_read_columns()
+
+#   Parallel parsing:
+#   'read_parallel()' splits the file into byte ranges that each end just past a newline, parses the ranges in a pool of worker processes
+#   (each worker reads its range and runs 'extractTable()' and 'parseTable()' on it), and joins the results in file order
+#   Files smaller than 'min_chunk' bytes are read by 'read()' (not worth starting the workers)
+def test_read_parallel():
+    #   {{{
+    test_file_path = None
+    with tempfile.NamedTemporaryFile(mode='w+', delete=False, newline='') as f:
+        f.write('Name,Age\r\n\n')
+        for i in range(500):
+            f.write('name-%d,%d\n' % (i, i))
+        test_file_path = f.name
+    for reader in (CSVReader(), MappedCSVReader()):
+        assert reader.read_parallel(test_file_path, processes=3, min_chunk=100) == CSVReader().read(test_file_path)
+    #   Chunks of an 'RFC4180Reader' begin at records, never inside a quoted field
+    with open(test_file_path, 'w') as f:
+        f.write('Name,Note\n')
+        for i in range(500):
+            f.write('name-%d,"line\n%d, ""quoted"""\n' % (i, i))
+    reader = RFC4180Reader()
+    assert reader.read_parallel(test_file_path, processes=3, min_chunk=100) == reader.read(test_file_path)
+    os.remove(test_file_path)
+    #   }}}
+#   (worker processes may re-import this file, so only the main process runs the test)
+if __name__ == '__main__':
+    test_read_parallel()
+
+#   Row index:
+#   'read_rows(path, start, stop)' gives 'read(path)[start:stop]' by reading only those rows, using a sidecar index ('<path>.idx', or '<path>.records.idx' for 'RFC4180Reader')
+#   of the byte offset of every row, which is built on first use, and rebuilt when the file's size or mtime no longer match it
+#   (the index is memory-mapped, and only the two offsets bounding the range are read from it)
+def test_read_rows():
+    #   {{{
+    test_file_path = None
+    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as f:
+        f.write('Name,Age\n\n')
+        for i in range(1000):
+            f.write('name-%d,%d\n' % (i, i))
+        test_file_path = f.name
+    reader = CSVReader()
+    assert reader.read_rows(test_file_path, 500, 510) == reader.read(test_file_path)[500:510]
+    assert os.path.exists(test_file_path + '.idx')
+    assert reader.read_rows(test_file_path, 995, 2000) == reader.read(test_file_path)[995:]
+    assert reader.read_rows(test_file_path, 2000, 3000) == []
+    assert reader.read_rows(test_file_path, -3, -1) == reader.read(test_file_path)[-3:-1]
+    assert reader.read_rows(test_file_path, -5000, 2) == reader.read(test_file_path)[:2]
+    assert reader.read_rows(test_file_path, 5, -2000) == []
+    with open(test_file_path, 'a') as f:
+        f.write('extra,1\n')
+    assert reader.read_rows(test_file_path, 1001, 1002) == [ ['extra', 1.0] ]
+    #   A lone '\r' ends a row in the index, as it does for 'read()'
+    with open(test_file_path, 'w', newline='') as f:
+        f.write('a,b\rc,d\r\n\re,"f\rg"\n')
+    for reader in (CSVReader(), MappedCSVReader(), RFC4180Reader()):
+        rows = reader.read(test_file_path)
+        assert [ reader.read_rows(test_file_path, i, i + 1) for i in range(len(rows)) ] == [ [ row ] for row in rows ]
+    assert len(CSVReader().read(test_file_path)) == 4 and len(RFC4180Reader().read(test_file_path)) == 3
+    os.remove(test_file_path)
+    os.remove(test_file_path + '.idx')
+    os.remove(test_file_path + '.records.idx')
+    #   }}}
+test_read_rows()
+
+#   Quoted fields:
+#   'RFC4180Reader' reads quoted fields (which may contain ',', '\n', and '""' for a quote), tokenising and parsing in one pass:
+#   each unquoted field goes through 'parseCell()' as it is emitted, and a quoted field is kept as str
+#   Lines without a quote take the same 'split()' path as 'CSVReader', only lines containing a quote go through the state machine
+def test_RFC4180Reader():
+    #   {{{
+    test_file_path = None
+    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as f:
+        f.write('Name,Age,Note\nAlice,30,"likes ""tea"", and cake"\n\n"Bob\nSmith",35,"40"\nCarol,,\n')
+        test_file_path = f.name
+    expected = [ ['Name', 'Age', 'Note'], ['Alice', 30.0, 'likes "tea", and cake'], ['Bob\nSmith', 35.0, '40'], ['Carol', '', ''] ]
+    reader = RFC4180Reader()
+    assert reader.read(test_file_path) == expected
+    assert list(reader.iter_rows(test_file_path)) == expected
+    #   The row index follows records, not lines
+    assert reader.read_rows(test_file_path, 1, 3) == expected[1:3]
+    assert reader.read_rows(test_file_path, -1, 4) == expected[-1:]
+    os.remove(test_file_path + '.records.idx')
+    with open(test_file_path, 'w') as f:
+        f.write('Name,Age\nAlice,30\n\nBob,35.5,\n')
+    assert reader.read(test_file_path) == CSVReader().read(test_file_path)
+    for invalid in ('a,"b\n', 'a,"b"c\n'):
+        with open(test_file_path, 'w') as f:
+            f.write(invalid)
+        try:
+            reader.read(test_file_path)
+            assert False
+        except ValueError:
+            pass
+    os.remove(test_file_path)
+    #   }}}
+test_RFC4180Reader()
+
+#   Compressed files:
+#   'CSVReader.openFile()' recognises gzip/bz2/xz files, and decompresses them on a background thread into a bounded queue,
+#   which the text stream reads from, so parsing overlaps decompression (and 'iter_rows()' never holds the whole decompressed file)
+#   ('read_parallel()' reads a compressed file with 'read()', and 'read_rows()' raises ValueError, as neither can seek into one)
+def test_compressed_CSVReader():
+    #   {{{
+    test_file_path = None
+    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as f:
+        f.write('Name,Age\n')
+        for i in range(5000):
+            f.write('name-%d,%d\n' % (i, i))
+        test_file_path = f.name
+    reader = CSVReader()
+    expected = reader.read(test_file_path)
+    with open(test_file_path, 'rb') as f:
+        data = f.read()
+    for codec in (gzip, bz2, lzma):
+        with open(test_file_path, 'wb') as f:
+            f.write(codec.compress(data))
+        assert reader.read(test_file_path) == expected
+        assert list(reader.iter_rows(test_file_path)) == expected
+        assert RFC4180Reader().read(test_file_path) == expected
+        mapped = MappedCSVReader()
+        assert mapped.read(test_file_path) == expected and list(mapped.iter_rows(test_file_path)) == expected
+        assert list(mapped.view(test_file_path)[-1]) == [ 'name-4999', '4999' ]
+        assert mapped.read_columns(test_file_path) == reader.read_columns(test_file_path)
+        assert mapped.read_parallel(test_file_path, processes=2, min_chunk=100) == expected
+    rows = reader.iter_rows(test_file_path)
+    assert next(rows) == ['Name', 'Age']
+    rows.close()
+    try:
+        reader.read_rows(test_file_path, 0, 1)
+        assert False
+    except ValueError:
+        pass
+    os.remove(test_file_path)
+    #   }}}
+test_compressed_CSVReader()
+
+#   Many files:
+#   'AsyncTableReader.read_many()' reads files on a pool of 'concurrency' threads, so waiting on the disk for one file overlaps
+#   with opening/reading the others, and yields each table (from the wrapped reader's 'read()') as soon as it is complete
+def test_AsyncTableReader():
+    #   {{{
+    test_file_paths = []
+    for i in range(20):
+        with tempfile.NamedTemporaryFile(mode='w+', delete=False) as f:
+            f.write('Name,Index\nfile-%d,%d\n' % (i, i))
+            test_file_paths.append(f.name)
+    async def read_all():
+        return [ result async for result in AsyncTableReader(CSVReader()).read_many(test_file_paths, concurrency=4) ]
+    results = asyncio.run(read_all())
+    assert sorted( path for (path, table) in results ) == sorted(test_file_paths)
+    for (path, table) in results:
+        assert table == CSVReader().read(path)
+    #   Up to 'concurrency' reads run at once (however many threads the event loop's default executor has)
+    class SlowReader(CSVReader):
+        running, peak, lock = 0, 0, threading.Lock()
+        def read(self, path):
+            with self.lock:
+                SlowReader.running += 1
+                SlowReader.peak = max(SlowReader.peak, SlowReader.running)
+            time.sleep(0.05)
+            with self.lock:
+                SlowReader.running -= 1
+            return super().read(path)
+    async def read_slowly():
+        return [ result async for result in AsyncTableReader(SlowReader()).read_many(test_file_paths, concurrency=20) ]
+    assert len(asyncio.run(read_slowly())) == 20 and SlowReader.peak == 20
+    #   Stopping early, or a read that raises, leaves no reads pending
+    async def read_first():
+        results = AsyncTableReader(CSVReader()).read_many(test_file_paths, concurrency=4)
+        first = await results.__anext__()
+        await results.aclose()
+        return first, len(asyncio.all_tasks())
+    (path, table), pending = asyncio.run(read_first())
+    assert table == CSVReader().read(path) and pending == 1
+    async def read_missing():
+        try:
+            async for result in AsyncTableReader(CSVReader()).read_many([ test_file_paths[0] + '.missing' ] + test_file_paths):
+                pass
+            assert False
+        except FileNotFoundError:
+            pass
+        return len(asyncio.all_tasks())
+    assert asyncio.run(read_missing()) == 1
+    for path in test_file_paths:
+        os.remove(path)
+    #   }}}
+test_AsyncTableReader()
+
+#   Cached tables:
+#   'CachedCSVReader' writes each table it parses to a binary columnar cache file ('<path>.cache', or in 'cache_dir'),
+#   and reads that instead of parsing, while the file's size and mtime still match those recorded in the cache
+def test_CachedCSVReader():
+    #   {{{
+    test_file_path = None
+    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as f:
+        f.write('Name,Age,Note\nAlice,30,x\n\nBob,35.5\nZoë,40,\n')
+        test_file_path = f.name
+    expected = CSVReader().read(test_file_path)
+    reader = CachedCSVReader()
+    assert reader.read(test_file_path) == expected
+    assert os.path.exists(test_file_path + '.cache')
+    assert reader.read(test_file_path) == expected
+    with open(test_file_path, 'a') as f:
+        f.write('Carol,41,y\n')
+    assert reader.read(test_file_path) == expected + [ ['Carol', 41.0, 'y'] ]
+    assert reader.read(test_file_path) == expected + [ ['Carol', 41.0, 'y'] ]
+    #   Columns alone are read from the cache, without opening the file
+    cached = CachedCSVReader()
+    cached.openFile = None
+    for columns in ([ 2, 0 ], [ -1 ], [ 5 ]):
+        assert cached.read(test_file_path, columns=columns) == CSVReader().read(test_file_path, columns=columns)
+    #   A truncated cache is ignored (and rewritten)
+    for size in (4, 60, os.path.getsize(test_file_path + '.cache') - 1):
+        with open(test_file_path + '.cache', 'r+b') as f:
+            f.truncate(size)
+        assert reader.read(test_file_path) == expected + [ ['Carol', 41.0, 'y'] ]
+    os.remove(test_file_path + '.cache')
+    with tempfile.TemporaryDirectory() as cache_dir:
+        assert CachedCSVReader(cache_dir).read(test_file_path) == CachedCSVReader(cache_dir).read(test_file_path)
+        assert len(os.listdir(cache_dir)) == 1
+    os.remove(test_file_path)
+    #   }}}
+test_CachedCSVReader()
+
+#   Selecting columns and rows:
+#   'read(path, columns, where)' reads only the 'columns' (indexes) of each row, and only the rows for which 'where(row)' is true
+#   'where' is given the selected fields before they are parsed, so rejected rows are never converted,
+#   and 'extractRows()' lets each reader skip unselected fields while tokenising ('CSVReader' only splits as far as the last selected column)
+#   (a selected field past the end of a short row is read as '', as an empty field would be)
+def test_read_columns_where():
+    #   {{{
+    test_file_path = None
+    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as f:
+        f.write('Name,Age,City,Salary,Note\n')
+        for i in range(50):
+            f.write('name-%d,%d,city-%d,%d.5,note\n' % (i, i, i % 3, i * 1000))
+        test_file_path = f.name
+    expected = [ [ row[0], row[2], row[3] ] for row in CSVReader().read(test_file_path) if row[2] == 'city-1' ]
+    class CountingReader:
+        def parseCell(self, cell):
+            self.parsed += 1
+            return super().parseCell(cell)
+    for reader in (CSVReader, MappedCSVReader, RFC4180Reader, CachedCSVReader):
+        reader = type('Counting' + reader.__name__, (CountingReader, reader), {})()
+        reader.parsed = 0
+        assert reader.read(test_file_path, columns=[0, 2, 3], where=lambda row: row[1] == 'city-1') == expected
+        assert reader.parsed == 3 * len(expected) == 51
+        assert reader.read(test_file_path, columns=[-1]) == [ ['Note'] ] + [ ['note'] ] * 50
+    with open(test_file_path, 'w') as f:
+        f.write('a,b,c\n1,2\n')
+    for reader in (CSVReader(), MappedCSVReader(), RFC4180Reader(), CachedCSVReader()):
+        assert reader.read(test_file_path, columns=[2, 0]) == [ ['c', 'a'], ['', 1.0] ]
+        assert reader.read(test_file_path, columns=[2], where=lambda row: row[0] == '') == [ [''] ]
+    os.remove(test_file_path)
+    #   }}}
+test_read_columns_where()
 #   }}}
 
 
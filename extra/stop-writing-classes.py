@@ -6,8 +6,30 @@
 #   {{{
 #   Ongoing: 2023-02-23T22:50:26AEDT Game of Life, (talk source for before/after) (that 'After' 'advance()' function is so much more horrible than class version (did we see all of class version?)) [...] (apply "we don't need a dict, just use a set" optimisation to class version?)
 #   }}}
+import sys
+import collections
 import functools
+import re
 import itertools
+import gzip
+import mmap
+import os
+import tempfile
+import argparse
+import json
+import random
+import math
+import time
+import tracemalloc
+import asyncio
+import struct
+import zlib
+import multiprocessing
+from multiprocessing import shared_memory
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 #   Continue: 2023-02-23T22:55:56AEDT simplified Game of Life (Before) version
 
@@ -68,9 +90,12 @@ class Cell:
         yield (self.x - 1, self.y + 1)
         yield (self.x - 1, self.y - 1)
 class Board:
-    def __init__(self, glider):
-        self.cells = set( [ point for point in glider ] )
+    def __init__(self, glider, storage=set):
+        self.cells = storage( [ point for point in glider ] )
     def advance(self):
+        if not isinstance(self.cells, set):
+            self.cells = advance(self.cells)
+            return
         newstate = set()
         recalc = self.cells | set(itertools.chain(*[ Cell(*point).neighbours() for point in self.cells]))
         for point in recalc:
@@ -94,6 +119,7 @@ def neighbours(point):
     yield (x + 1, y - 1)
     yield (x - 1, y + 1)
     yield (x - 1, y - 1)
+@functools.singledispatch
 def advance(board):
     newstate = set()
     recalc = board | set(itertools.chain(*map(neighbours, board)))
@@ -107,3 +133,1361 @@ for i in range(10):
     glider = advance(glider)
 print(glider)
 
+
+
+#   Engines:
+#   (the set-of-points 'advance()' above is the reference, each engine below must agree with it)
+#
+#   Dense grid: (numpy)
+#   {{{
+#   The board is a 2D uint8 array, indexed 'grid[y, x]', covering the points from 'origin' to 'origin + shape'
+#   Neighbours are counted by summing the 8 shifted views of a grid padded by one cell:
+#   zeros for bounded edges (cells beyond the edge are dead), or wrapped values for toroidal edges
+#   (leading axes are left alone, so a stack of boards can be advanced at once)
+_OFFSETS = [ (dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if (dy, dx) != (0, 0) ]
+def to_grid(board, shape, origin=(0,0)):
+    grid = np.zeros(shape, dtype=np.uint8)
+    ox, oy = origin
+    h, w = shape
+    for (x, y) in board:
+        if not (0 <= x - ox < w and 0 <= y - oy < h):
+            raise ValueError("point=(%s, %s) outside grid of shape=(%s) at origin=(%s)" % (x, y, shape, origin))
+        grid[y - oy, x - ox] = 1
+    return grid
+def from_grid(grid, origin=(0,0)):
+    ox, oy = origin
+    ys, xs = np.nonzero(grid)
+    return set( (int(x) + ox, int(y) + oy) for (x, y) in zip(xs, ys) )
+def _pad_grid(grid, wrap):
+    pad_width = [ (0, 0) ] * (grid.ndim - 2) + [ (1, 1), (1, 1) ]
+    return np.pad(grid, pad_width, mode='wrap' if wrap else 'constant')
+def _neighbour_counts(padded):
+    h, w = padded.shape[-2] - 2, padded.shape[-1] - 2
+    counts = np.zeros(padded.shape[:-2] + (h, w), dtype=np.uint8)
+    for (dy, dx) in _OFFSETS:
+        counts += padded[..., 1+dy:1+dy+h, 1+dx:1+dx+w]
+    return counts
+def _grid_rule(grid, counts):
+    return ((counts == 3) | ((counts == 2) & (grid == 1))).astype(np.uint8)
+def advance_grid(grid, wrap=False, rule=None):
+    if rule is not None:
+        return _grid_lookup(_pad_grid(grid, wrap), rule)
+    return _grid_rule(grid, _neighbour_counts(_pad_grid(grid, wrap)))
+
+def test_advance_grid():
+    #   {{{
+    glider = set( [ (0,0), (1,0), (2,0), (0,1), (1,2), ] )
+    origin = (-10, -10)
+    bounded = to_grid(glider, (20, 20), origin)
+    toroidal = to_grid(glider, (20, 20), origin)
+    for i in range(10):
+        glider = advance(glider)
+        bounded = advance_grid(bounded)
+        toroidal = advance_grid(toroidal, wrap=True)
+    assert from_grid(bounded, origin) == glider
+    assert from_grid(toroidal, origin) == glider
+    #   A glider on a 6x6 torus returns to its starting cells after 24 generations
+    start = to_grid([ (0,0), (1,0), (2,0), (0,1), (1,2), ], (6, 6))
+    grid = start
+    for i in range(24):
+        grid = advance_grid(grid, wrap=True)
+    assert (grid == start).all()
+    for outside in ([ (-1, 0) ], [ (0, 6) ]):
+        try:
+            to_grid(outside, (6, 6))
+            assert False
+        except ValueError:
+            pass
+    #   }}}
+if np is not None:
+    test_advance_grid()
+#   }}}
+
+
+#   HashLife: (quadtree)
+#   {{{
+#   A node of level k is a 2^k square, made of 4 level k-1 quadrants (a=NW, b=NE, c=SW, d=SE)
+#   Nodes are hash-consed (each distinct square exists once), so identical regions share both storage and results
+#   The result of a level k node is its centre level k-1 square, 2^j generations later (j <= k-2), and is memoized
+#   (Containers are a good use case for classes: 'HashLife' owns the node and result tables)
+class Node:
+    __slots__ = ('k', 'a', 'b', 'c', 'd', 'n')
+    def __init__(self, k, a, b, c, d, n):
+        self.k = k
+        self.a, self.b, self.c, self.d = a, b, c, d
+        self.n = n
+class _NodeLimit(Exception):
+    pass
+class HashLife:
+    def __init__(self, cells, max_nodes=2**20):
+        self.max_nodes = max_nodes
+        self.generation = 0
+        self._limit = max_nodes
+        self._guarded = False
+        self._root = None
+        self._nodes = dict()
+        self._results = dict()
+        self._zeros = dict()
+        self._off = Node(0, None, None, None, None, 0)
+        self._on = Node(0, None, None, None, None, 1)
+        self._construct(set(cells))
+    def _join(self, a, b, c, d):
+        key = (a, b, c, d)
+        node = self._nodes.get(key)
+        if node is None:
+            if self._guarded and len(self._nodes) >= self._limit:
+                raise _NodeLimit()
+            node = Node(a.k + 1, a, b, c, d, a.n + b.n + c.n + d.n)
+            self._nodes[key] = node
+        return node
+    def _zero(self, k):
+        if k == 0:
+            return self._off
+        node = self._zeros.get(k)
+        if node is None:
+            z = self._zero(k - 1)
+            node = self._zeros[k] = self._join(z, z, z, z)
+        return node
+    def _centre(self, m):
+        #   Embed 'm' in the middle of a node twice its size
+        z = self._zero(m.k - 1)
+        return self._join(self._join(z, z, z, m.a), self._join(z, z, m.b, z), self._join(z, m.c, z, z), self._join(m.d, z, z, z))
+    def _is_padded(self, m):
+        #   All live cells lie in the innermost quarter-width square
+        return m.a.n == m.a.d.d.n and m.b.n == m.b.c.c.n and m.c.n == m.c.b.b.n and m.d.n == m.d.a.a.n
+    def _life_4x4(self, m):
+        cells = [ [ q.a, q.b, q.c, q.d ] for q in (m.a, m.b, m.c, m.d) ]
+        def alive(x, y):
+            return cells[(y >> 1) * 2 + (x >> 1)][(y & 1) * 2 + (x & 1)].n
+        def rule(x, y):
+            count = sum( alive(x + dx, y + dy) for (dy, dx) in _OFFSETS )
+            return self._on if count == 3 or (count == 2 and alive(x, y)) else self._off
+        return self._join(rule(1, 1), rule(2, 1), rule(1, 2), rule(2, 2))
+    def _successor(self, m, j):
+        key = (m, j)
+        result = self._results.get(key)
+        if result is not None:
+            return result
+        join = self._join
+        if m.n == 0:
+            result = m.a
+        elif m.k == 2:
+            result = self._life_4x4(m)
+        else:
+            a, b, c, d = m.a, m.b, m.c, m.d
+            #   9 overlapping level k-1 sub-squares, each advanced and reduced to its level k-2 centre
+            c1 = self._successor(join(a.a, a.b, a.c, a.d), j)
+            c2 = self._successor(join(a.b, b.a, a.d, b.c), j)
+            c3 = self._successor(join(b.a, b.b, b.c, b.d), j)
+            c4 = self._successor(join(a.c, a.d, c.a, c.b), j)
+            c5 = self._successor(join(a.d, b.c, c.b, d.a), j)
+            c6 = self._successor(join(b.c, b.d, d.a, d.b), j)
+            c7 = self._successor(join(c.a, c.b, c.c, c.d), j)
+            c8 = self._successor(join(c.b, d.a, c.d, d.c), j)
+            c9 = self._successor(join(d.a, d.b, d.c, d.d), j)
+            if j < m.k - 2:
+                #   The first half of the jump covers all 2^j generations, take the centres without advancing again
+                result = join(join(c1.d, c2.c, c4.b, c5.a), join(c2.d, c3.c, c5.b, c6.a),
+                              join(c4.d, c5.c, c7.b, c8.a), join(c5.d, c6.c, c8.b, c9.a))
+            else:
+                result = join(self._successor(join(c1, c2, c4, c5), j), self._successor(join(c2, c3, c5, c6), j),
+                              self._successor(join(c4, c5, c7, c8), j), self._successor(join(c5, c6, c8, c9), j))
+        self._results[key] = result
+        return result
+    def _construct(self, cells):
+        #   'self._origin' is the (x, y) of the NW corner of 'self._root'
+        if len(cells) == 0:
+            self._root, self._origin = self._zero(3), (-4, -4)
+            return
+        min_x = min( x for (x, y) in cells )
+        min_y = min( y for (x, y) in cells )
+        level = { (x - min_x, y - min_y): self._on for (x, y) in cells }
+        k = 0
+        while len(level) != 1 or k < 1:
+            z = self._zero(k)
+            next_level = dict()
+            while len(level) > 0:
+                x, y = next(iter(level))
+                x, y = x - (x & 1), y - (y & 1)
+                next_level[x >> 1, y >> 1] = self._join(level.pop((x, y), z), level.pop((x + 1, y), z), level.pop((x, y + 1), z), level.pop((x + 1, y + 1), z))
+            level = next_level
+            k += 1
+        self._root, self._origin = level.popitem()[1], (min_x, min_y)
+    def _pad(self, j):
+        while self._root.k < j + 3 or not self._is_padded(self._root):
+            half = 1 << (self._root.k - 1)
+            self._root = self._centre(self._root)
+            self._origin = (self._origin[0] - half, self._origin[1] - half)
+    def _step(self, j, collected=False):
+        #   Advance 2^j generations: 'successor()' returns the centre of the root, offset by a quarter of its width
+        #   A jump that fills the node table is abandoned, the table collected, and the jump retried
+        #   If it fills a freshly collected table, the jump needs more than the limit allows, so the limit is doubled rather than
+        #   collecting again (and throwing away the memoized results the jump depends on) every few joins
+        self._pad(j)
+        self._guarded = True
+        try:
+            root = self._successor(self._root, j)
+        except _NodeLimit:
+            if collected:
+                self._limit *= 2
+            else:
+                self._collect()
+            self._step(j, True)
+            return
+        finally:
+            self._guarded = False
+        quarter = 1 << (self._root.k - 2)
+        self._root = root
+        self._origin = (self._origin[0] + quarter, self._origin[1] + quarter)
+        self.generation += 1 << j
+        if len(self._nodes) > self.max_nodes:
+            self._collect()
+    def _collect(self):
+        #   Evict every node not reachable from the root, and all memoized results (which would keep evicted nodes alive)
+        #   The limit is reset, or raised to twice what the root alone needs (so every jump isn't abandoned)
+        nodes = dict()
+        stack = [ self._root ] if self._root is not None else []
+        while len(stack) > 0:
+            m = stack.pop()
+            key = (m.a, m.b, m.c, m.d)
+            if m.k == 0 or key in nodes:
+                continue
+            nodes[key] = m
+            stack.extend(key)
+        self._nodes = nodes
+        self._results = dict()
+        self._zeros = dict()
+        self._limit = max(self.max_nodes, 2 * len(nodes))
+    def advance_by(self, n):
+        #   Decompose 'n' into powers of 2, each is a single memoized jump
+        j = 0
+        while n > 0:
+            if n & 1:
+                self._step(j)
+            n >>= 1
+            j += 1
+        return self.cells
+    @property
+    def cells(self):
+        result = set()
+        def expand(m, x, y):
+            if m.n == 0:
+                return
+            if m.k == 0:
+                result.add((x, y))
+                return
+            half = 1 << (m.k - 1)
+            expand(m.a, x, y)
+            expand(m.b, x + half, y)
+            expand(m.c, x, y + half)
+            expand(m.d, x + half, y + half)
+        expand(self._root, *self._origin)
+        return result
+
+def test_HashLife():
+    #   {{{
+    glider = set( [ (0,0), (1,0), (2,0), (0,1), (1,2), ] )
+    life = HashLife(glider)
+    expected = glider
+    for n in (1, 2, 3, 10, 0, 7):
+        for i in range(n):
+            expected = advance(expected)
+        assert life.advance_by(n) == expected
+    assert life.generation == 23
+    #   A glider moves (-1,-1) every 4 generations, so a jump of 2^20 generations is a translation
+    life = HashLife(glider, max_nodes=2**8)
+    shift = -(2**20) // 4
+    assert life.advance_by(2**20) == set( (x + shift, y + shift) for (x, y) in glider )
+    assert len(life._nodes) <= 2**8
+    #   A chaotic soup stays within the node limit during a jump (and matches 'advance()')
+    rng = random.Random(2)
+    soup = set( (x, y) for x in range(24) for y in range(24) if rng.random() < 0.4 )
+    life = HashLife(soup, max_nodes=2000)
+    join = life._join
+    def checked_join(*quadrants):
+        assert len(life._nodes) <= life._limit
+        return join(*quadrants)
+    life._join = checked_join
+    expected = soup
+    for i in range(64):
+        expected = advance(expected)
+    assert life.advance_by(64) == expected
+    assert len(life._nodes) <= 2000
+    #   A pair of colliding gliders leaves 'advance()' and 'HashLife' with the same debris
+    pattern = glider | set( (-x + 8, y - 12) for (x, y) in [ (0,0), (1,0), (2,0), (2,1), (1,2), ] )
+    expected = pattern
+    for i in range(60):
+        expected = advance(expected)
+    assert HashLife(pattern).advance_by(60) == expected
+    #   }}}
+test_HashLife()
+#   }}}
+
+
+#   Active region: (incremental)
+#   {{{
+#   A cell can only change if something in its neighbourhood changed in the previous generation
+#   'step_active()' re-evaluates only the cells around 'active' (the cells that changed last generation, or the whole board to begin with)
+#   and applies the result to 'board' in place, so the cost of a step follows the activity rather than the population
+def apply_delta(board, births, deaths):
+    board -= deaths
+    board |= births
+    return board
+def step_active(board, active):
+    recalc = active | set(itertools.chain(*map(neighbours, active)))
+    births, deaths = set(), set()
+    for point in recalc:
+        count = sum( (n in board) for n in neighbours(point) )
+        if point in board:
+            if count != 2 and count != 3:
+                deaths.add(point)
+        elif count == 3:
+            births.add(point)
+    apply_delta(board, births, deaths)
+    return births, deaths, len(recalc)
+
+def test_step_active():
+    #   {{{
+    glider = set( [ (0,0), (1,0), (2,0), (0,1), (1,2), ] )
+    blocks = set( (x + dx, y + dy) for x in range(100, 200, 10) for y in range(100, 200, 10) for (dx, dy) in [ (0,0), (0,1), (1,0), (1,1), ] )
+    board = glider | blocks
+    expected = set(board)
+    active = set(board)
+    evaluated = []
+    for i in range(10):
+        births, deaths, count = step_active(board, active)
+        active = births | deaths
+        evaluated.append(count)
+        expected = advance(expected)
+        assert board == expected
+    #   After the first step only the glider is re-evaluated, not the 100 blocks
+    assert evaluated[0] > len(blocks)
+    assert max(evaluated[1:]) < 50
+    #   }}}
+test_step_active()
+#   }}}
+
+
+#   Bitboard: (numpy)
+#   {{{
+#   Each row is packed into uint64 words, bit i of word w is the cell 'origin + (64*w + i, row)'
+#   Neighbour planes are whole-word shifts (with the carry taken from the adjacent word),
+#   and the 8 planes are summed with bitwise full-adders, so each operation handles 64 cells
+#   'advance()' dispatches on the board type, so a 'BitBoard' goes through the same entry point as a set
+class BitBoard:
+    def __init__(self, words, origin):
+        self.words = words
+        self.origin = origin
+def to_bitboard(board):
+    if len(board) == 0:
+        return BitBoard(np.zeros((3, 1), dtype='<u8'), (-1, -1))
+    min_x = min( x for (x, y) in board )
+    min_y = min( y for (x, y) in board )
+    width = max( x for (x, y) in board ) - min_x + 3
+    height = max( y for (x, y) in board ) - min_y + 3
+    origin = (min_x - 1, min_y - 1)
+    grid = to_grid(board, (height, -(-width // 64) * 64), origin)
+    return BitBoard(np.packbits(grid, axis=-1, bitorder='little').view('<u8'), origin)
+def from_bitboard(bits):
+    return from_grid(np.unpackbits(bits.words.view(np.uint8), axis=-1, bitorder='little'), bits.origin)
+def _bit_neighbours(rows):
+    #   The 8 neighbour planes of 'rows', each has the value of a neighbour moved onto the cell it neighbours
+    one, top = np.uint64(1), np.uint64(63)
+    west = rows << one
+    west[..., 1:] |= rows[..., :-1] >> top
+    east = rows >> one
+    east[..., :-1] |= rows[..., 1:] << top
+    planes = [ west, east ]
+    for row in (rows, west, east):
+        up = np.zeros_like(row)
+        up[..., 1:, :] = row[..., :-1, :]
+        down = np.zeros_like(row)
+        down[..., :-1, :] = row[..., 1:, :]
+        planes += [ up, down ]
+    return planes
+def _bit_rule(planes, cell):
+    #   Sum 8 one-bit planes into 'ones', 'twos', 'fours' (a count of 8 wraps to 0, which is dead either way)
+    def full_add(a, b, c):
+        return a ^ b ^ c, (a & b) | (c & (a ^ b))
+    n0, n1, n2, n3, n4, n5, n6, n7 = planes
+    s_a, c_a = full_add(n0, n1, n2)
+    s_b, c_b = full_add(n3, n4, n5)
+    s_c, c_c = n6 ^ n7, n6 & n7
+    ones, c_d = full_add(s_a, s_b, s_c)
+    t, c_e = full_add(c_a, c_b, c_c)
+    twos, c_f = t ^ c_d, t & c_d
+    fours = c_e ^ c_f
+    return twos & ~fours & (ones | cell)
+def _bit_grow(bits):
+    #   Keep a dead border around the live cells, so nothing is born outside the words
+    words, (ox, oy) = bits.words, bits.origin
+    one, top = np.uint64(1), np.uint64(63)
+    zero_cols = np.zeros((words.shape[0], 1), dtype=words.dtype)
+    if (words[:, 0] & one).any():
+        words, ox = np.hstack([ zero_cols, words ]), ox - 64
+    if (words[:, -1] >> top).any():
+        words = np.hstack([ words, zero_cols ])
+    zero_rows = np.zeros((64, words.shape[1]), dtype=words.dtype)
+    if words[0].any():
+        words, oy = np.vstack([ zero_rows, words ]), oy - 64
+    if words[-1].any():
+        words = np.vstack([ words, zero_rows ])
+    return BitBoard(words, (ox, oy))
+@advance.register
+def _(board: BitBoard):
+    board = _bit_grow(board)
+    return BitBoard(_bit_rule(_bit_neighbours(board.words), board.words), board.origin)
+
+def test_BitBoard():
+    #   {{{
+    glider = set( [ (0,0), (1,0), (2,0), (0,1), (1,2), ] )
+    #   A glider travelling across word boundaries, and a blinker at the edge of a word
+    board = glider | set( (x, 10) for x in (62, 63, 64) )
+    bits = to_bitboard(board)
+    for i in range(40):
+        board = advance(board)
+        bits = advance(bits)
+        assert from_bitboard(bits) == board
+    assert from_bitboard(to_bitboard(set())) == set()
+    #   }}}
+if np is not None:
+    test_BitBoard()
+#   }}}
+
+
+#   Tiled: (numpy, multiprocessing)
+#   {{{
+#   The dense grid is split into fixed-size tiles, which are advanced by a pool of worker processes
+#   Two grids live in shared memory (the current and next generation), each with a one-cell border: zero for a bounded grid,
+#   or refreshed once a generation with the opposite edges for a toroidal one, so each worker reads its tile plus halo as a plain slice
+#   of the current grid, and writes the tile into the next one (the swap between generations is the halo exchange)
+#   Every tile goes through the same '_neighbour_counts()' and '_grid_rule()' as 'advance_grid()', so results are identical
+_tile_shm = None
+_tile_buffers = None
+def _tile_worker_init(names, shape):
+    global _tile_shm, _tile_buffers
+    _tile_shm = [ shared_memory.SharedMemory(name=name) for name in names ]
+    _tile_buffers = [ np.ndarray(shape, dtype=np.uint8, buffer=shm.buf) for shm in _tile_shm ]
+def _advance_tile(args):
+    src, (y0, y1, x0, x1) = args
+    padded = _tile_buffers[src][y0:y1 + 2, x0:x1 + 2]
+    _tile_buffers[1 - src][y0 + 1:y1 + 1, x0 + 1:x1 + 1] = _grid_rule(padded[1:-1, 1:-1], _neighbour_counts(padded))
+def _wrap_border(padded):
+    #   Rows first, so the corners come from the opposite corners
+    padded[0, 1:-1] = padded[-2, 1:-1]
+    padded[-1, 1:-1] = padded[1, 1:-1]
+    padded[:, 0] = padded[:, -2]
+    padded[:, -1] = padded[:, 1]
+def advance_tiled(grid, generations, wrap=False, tile=256, processes=None):
+    h, w = grid.shape
+    tiles = [ (y0, min(y0 + tile, h), x0, min(x0 + tile, w)) for y0 in range(0, h, tile) for x0 in range(0, w, tile) ]
+    shape = (h + 2, w + 2)
+    shms = [ shared_memory.SharedMemory(create=True, size=shape[0] * shape[1]) for i in range(2) ]
+    buffers = [ np.ndarray(shape, dtype=np.uint8, buffer=shm.buf) for shm in shms ]
+    try:
+        for buffer in buffers:
+            buffer[:] = 0
+        buffers[0][1:-1, 1:-1] = grid
+        src = 0
+        with multiprocessing.Pool(processes, initializer=_tile_worker_init, initargs=([ shm.name for shm in shms ], shape)) as pool:
+            for i in range(generations):
+                if wrap:
+                    _wrap_border(buffers[src])
+                pool.map(_advance_tile, [ (src, t) for t in tiles ])
+                src = 1 - src
+        return buffers[src][1:-1, 1:-1].copy()
+    finally:
+        del buffers
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+def test_advance_tiled():
+    #   {{{
+    soup = (np.random.default_rng(5).random((100, 130)) < 0.3).astype(np.uint8)
+    for wrap in (False, True):
+        expected = soup
+        for i in range(8):
+            expected = advance_grid(expected, wrap)
+        assert (advance_tiled(soup, 8, wrap, tile=32, processes=2) == expected).all()
+    #   }}}
+#   (worker processes may re-import this file, so only the main process runs the test)
+if np is not None and __name__ == '__main__':
+    test_advance_tiled()
+#   }}}
+
+
+#   Deltas:
+#   {{{
+#   'deltas()' yields the (births, deaths) of each generation, so a consumer can follow a long run without comparing whole boards
+#   Only one board is held (a copy of the starting board, advanced in place by 'step_active()')
+#   ('apply_delta()', defined with 'step_active()', replays them onto a board in place)
+def deltas(board, generations=None):
+    board = set(board)
+    active = set(board)
+    steps = itertools.count() if generations is None else range(generations)
+    for i in steps:
+        births, deaths, evaluated = step_active(board, active)
+        yield births, deaths
+        active = births | deaths
+
+def test_deltas():
+    #   {{{
+    glider = set( [ (0,0), (1,0), (2,0), (0,1), (1,2), ] )
+    board = set(glider)
+    expected = glider
+    for (births, deaths) in deltas(glider, 10):
+        expected = advance(expected)
+        assert apply_delta(board, births, deaths) == expected
+    assert glider == set( [ (0,0), (1,0), (2,0), (0,1), (1,2), ] )
+    #   }}}
+test_deltas()
+#   }}}
+
+
+#   Cycle detection:
+#   {{{
+#   Each generation is normalised to its bounding-box corner, so a spaceship repeats the same normalised board every period
+#   The last 'history' normalised boards are kept: once one repeats, the period (and the offset the pattern moves per period) is known,
+#   and the requested generation is looked up in the history and translated, instead of being simulated
+def _normalise(board):
+    if len(board) == 0:
+        return frozenset(), (0, 0)
+    min_x = min( x for (x, y) in board )
+    min_y = min( y for (x, y) in board )
+    return frozenset( (x - min_x, y - min_y) for (x, y) in board ), (min_x, min_y)
+def advance_many(board, generations, history=1024):
+    #   Returns the board after 'generations', and the (period, offset) found, or (None, None) if none was
+    #   Only the hash of each (normalised) generation is kept: a repeated hash is confirmed by advancing the current board by
+    #   the period and comparing, and the generations left over after whole periods are simulated from there
+    seen = dict()
+    hashes = dict()
+    for g in range(generations + 1):
+        key, origin = _normalise(board)
+        h = hash(key)
+        start = seen.get(h)
+        if start is not None and g + (g - start) <= generations:
+            period = g - start
+            later = board
+            for i in range(period):
+                later = advance(later)
+            later_key, later_origin = _normalise(later)
+            if later_key == key:
+                offset = (later_origin[0] - origin[0], later_origin[1] - origin[1])
+                cycles, rest = divmod(generations - g - period, period)
+                for i in range(rest):
+                    later = advance(later)
+                dx, dy = offset[0] * cycles, offset[1] * cycles
+                return set( (x + dx, y + dy) for (x, y) in later ), period, offset
+        if g == generations:
+            break
+        seen[h] = g
+        hashes[g] = h
+        if len(hashes) > history:
+            old = hashes.pop(g - history)
+            if seen.get(old) == g - history:
+                del seen[old]
+        board = advance(board)
+    return board, None, None
+
+def test_advance_many():
+    #   {{{
+    glider = set( [ (0,0), (1,0), (2,0), (0,1), (1,2), ] )
+    expected = glider
+    for i in range(37):
+        expected = advance(expected)
+    assert advance_many(glider, 37) == (expected, 4, (-1, -1))
+    shift = -(10**9) // 4
+    assert advance_many(glider, 10**9) == (set( (x + shift, y + shift) for (x, y) in glider ), 4, (-1, -1))
+    blinker = set( [ (0,0), (1,0), (2,0), ] )
+    assert advance_many(blinker, 10**9 + 1) == (advance(blinker), 2, (0, 0))
+    assert advance_many(set(), 10) == (set(), 1, (0, 0))
+    #   Too short a history to see the period
+    assert advance_many(glider, 37, history=3) == (expected, None, None)
+    #   A count that isn't a whole number of periods past the repeat is finished by simulation
+    expected = glider
+    for i in range(3):
+        expected = advance(expected)
+    shift = -(10**9) // 4
+    assert advance_many(glider, 10**9 + 3) == (set( (x + shift, y + shift) for (x, y) in expected ), 4, (-1, -1))
+    #   }}}
+test_advance_many()
+#   }}}
+
+
+#   Rule tables:
+#   {{{
+#   A Life-like rule 'B<births>/S<survivals>' (Life itself is 'B3/S23') is compiled into a 512-entry table,
+#   indexed by the 9-cell neighbourhood as a bitmask (bit '3*(dy+1) + (dx+1)', so the cell itself is bit 4)
+#   Both the sparse 'advance_rule()' and the dense 'advance_grid(grid, rule=table)' look each cell up, instead of testing counts
+def compile_rule(rule):
+    match = re.fullmatch(r'B([0-8]*)/S([0-8]*)', rule, re.IGNORECASE)
+    if match is None:
+        raise ValueError("rule=(%s) not in 'B<counts>/S<counts>' notation (counts 0-8)" % rule)
+    births = set( int(c) for c in match.group(1) )
+    survivals = set( int(c) for c in match.group(2) )
+    table = bytearray(512)
+    for mask in range(512):
+        count = bin(mask & ~(1 << 4)).count('1')
+        table[mask] = count in survivals if mask & (1 << 4) else count in births
+    return bytes(table)
+LIFE = compile_rule('B3/S23')
+_MASK_BITS = [ ((dy, dx), 3 * (dy + 1) + (dx + 1)) for dy in (-1, 0, 1) for dx in (-1, 0, 1) ]
+def advance_rule(board, table):
+    if table[0]:
+        raise ValueError("B0 rules give birth to the infinite empty plane, and cannot be advanced as a set of points")
+    #   Each live cell sets its bit in the mask of each cell around it (as 'advance_packed()' counts), so a cell is looked up once
+    masks = collections.defaultdict(int)
+    for (x, y) in board:
+        for ((dy, dx), bit) in _MASK_BITS:
+            masks[(x - dx, y - dy)] |= 1 << bit
+    return set( p for (p, mask) in masks.items() if table[mask] )
+def _grid_lookup(padded, table):
+    h, w = padded.shape[-2] - 2, padded.shape[-1] - 2
+    masks = np.zeros(padded.shape[:-2] + (h, w), dtype=np.uint16)
+    for ((dy, dx), bit) in _MASK_BITS:
+        masks |= padded[..., 1+dy:1+dy+h, 1+dx:1+dx+w].astype(np.uint16) << bit
+    return np.frombuffer(table, dtype=np.uint8)[masks]
+
+def test_compile_rule():
+    #   {{{
+    glider = set( [ (0,0), (1,0), (2,0), (0,1), (1,2), ] )
+    board, expected = glider, glider
+    for i in range(10):
+        board = advance_rule(board, LIFE)
+        expected = advance(expected)
+    assert board == expected
+    #   HighLife (B36/S23), the sparse and dense engines agree
+    highlife = compile_rule('b36/s23')
+    board = set( (x, y) for x in range(-6, 6) for y in range(-6, 6) if (x * 7 + y * 13) % 5 < 2 )
+    grid = to_grid(board, (60, 60), (-30, -30)) if np is not None else None
+    for i in range(12):
+        board = advance_rule(board, highlife)
+        if grid is not None:
+            grid = advance_grid(grid, rule=highlife)
+            assert from_grid(grid, (-30, -30)) == board
+    for invalid in ('B3S23', '3/23', 'B9/S23', 'Bx/S23'):
+        try:
+            compile_rule(invalid)
+            assert False, invalid
+        except ValueError:
+            pass
+    #   }}}
+test_compile_rule()
+#   }}}
+
+
+#   Batches: (numpy)
+#   {{{
+#   N independent boards stacked into an (N, height, width) array are advanced by one call to 'advance_grid()'
+#   (the padding and neighbour sums only touch the last two axes), so the Python overhead is paid once per batch
+def advance_batch(boards, wrap=False, rule=None):
+    boards = advance_grid(boards, wrap, rule)
+    population = boards.sum(axis=(-2, -1))
+    return boards, population, population == 0
+
+def test_advance_batch():
+    #   {{{
+    soups = (np.random.default_rng(9).random((50, 32, 32)) < 0.3).astype(np.uint8)
+    soups[7] = 0
+    soups[8] = to_grid([ (0,0), (1,0), ], (32, 32))
+    boards, population, died = advance_batch(soups, wrap=True)
+    for i in range(len(soups)):
+        assert (boards[i] == advance_grid(soups[i], wrap=True)).all()
+        assert population[i] == boards[i].sum()
+    assert died[7] and died[8] and died.sum() == 2
+    #   }}}
+if np is not None:
+    test_advance_batch()
+#   }}}
+
+
+#   Chunks: (numpy)
+#   {{{
+#   A dict from chunk coordinates to dense 64x64 blocks, each block is 64 uint64 rows (bit i of row j is the cell '64*chunk + (i, j)')
+#   Blocks are stepped with the bitboard full-adder, taking the edge rows/bits of the 8 surrounding blocks as their halo
+#   A block is allocated when a birth lands in it, and freed once it has been empty for 'ttl' generations,
+#   so memory follows the occupied area (not the bounding box, or the number of cells)
+#   ('Board(cells, storage=ChunkWorld)' keeps its cells in a 'ChunkWorld', which 'advance()' steps in place)
+class ChunkWorld:
+    def __init__(self, cells=(), ttl=8):
+        self.ttl = ttl
+        self.chunks = dict()
+        self.idle = dict()
+        one = np.uint64(1)
+        for (x, y) in cells:
+            rows = self.chunks.setdefault((x >> 6, y >> 6), np.zeros(64, dtype='<u8'))
+            rows[y & 63] |= one << np.uint64(x & 63)
+    def __iter__(self):
+        for ((cx, cy), rows) in self.chunks.items():
+            ys, xs = np.nonzero(np.unpackbits(rows.view(np.uint8), bitorder='little').reshape(64, 64))
+            for (x, y) in zip(xs, ys):
+                yield (int(x) + 64 * cx, int(y) + 64 * cy)
+    def __len__(self):
+        return sum( int(np.unpackbits(rows.view(np.uint8)).sum()) for rows in self.chunks.values() )
+    def __contains__(self, point):
+        x, y = point
+        rows = self.chunks.get((x >> 6, y >> 6))
+        return rows is not None and bool((rows[y & 63] >> np.uint64(x & 63)) & np.uint64(1))
+    def _step_chunk(self, cx, cy, zero):
+        #   Each column of blocks (left, centre, right) is extended to 66 rows with the edge rows of the blocks above and below
+        get = lambda dx, dy: self.chunks.get((cx + dx, cy + dy), zero)
+        left, centre, right = [ np.concatenate([ get(dx, -1)[-1:], get(dx, 0), get(dx, 1)[:1] ]) for dx in (-1, 0, 1) ]
+        one, top = np.uint64(1), np.uint64(63)
+        west = (centre << one) | (left >> top)
+        east = (centre >> one) | (right << top)
+        planes = [ west[1:-1], east[1:-1], centre[:-2], centre[2:], west[:-2], west[2:], east[:-2], east[2:] ]
+        return _bit_rule(planes, centre[1:-1])
+    def step(self):
+        zero = np.zeros(64, dtype='<u8')
+        occupied = [ key for (key, rows) in self.chunks.items() if rows.any() ]
+        candidates = set( (cx + dx, cy + dy) for (cx, cy) in occupied for dx in (-1, 0, 1) for dy in (-1, 0, 1) )
+        chunks = dict()
+        for (cx, cy) in candidates:
+            rows = self._step_chunk(cx, cy, zero)
+            if (cx, cy) in self.chunks or rows.any():
+                chunks[cx, cy] = rows
+        for key in self.chunks.keys() - candidates:
+            chunks[key] = zero.copy()
+        for (key, rows) in chunks.items():
+            self.idle[key] = 0 if rows.any() else self.idle.get(key, 0) + 1
+        for key in [ key for (key, n) in self.idle.items() if n > self.ttl ]:
+            del chunks[key]
+            del self.idle[key]
+        self.chunks = chunks
+@advance.register
+def _(board: ChunkWorld):
+    board.step()
+    return board
+
+def test_ChunkWorld():
+    #   {{{
+    glider = set( [ (0,0), (1,0), (2,0), (0,1), (1,2), ] )
+    board = Board(glider, storage=ChunkWorld)
+    expected = glider
+    for i in range(140):
+        board.advance()
+        expected = advance(expected)
+        assert set(board.cells) == expected
+    #   The glider has crossed into a third chunk, and the chunks it left have been freed
+    assert len(board.cells.chunks) <= 4
+    assert len(board.cells) == 5 and (-35, -35) in board.cells
+    #   Blocks straddling chunk corners
+    blocks = set( (x + dx, y + dy) for (x, y) in [ (63, 63), (-1, 63), (127, 0), ] for dx in (0, 1) for dy in (0, 1) )
+    world = ChunkWorld(blocks | glider)
+    expected = blocks | glider
+    for i in range(20):
+        world = advance(world)
+        expected = advance(expected)
+    assert set(world) == expected
+    #   }}}
+if np is not None:
+    test_ChunkWorld()
+#   }}}
+
+
+#   Packed coordinates:
+#   {{{
+#   '(x, y)' is packed into the single int '(y + 2^31) << 32 | (x + 2^31)', so a neighbour is an int offset
+#   That needs a cell of headroom either side (a neighbour past 2^31 - 1 would carry into y), so packed points are limited to
+#   -2^31 < x, y < 2^31 - 1 ('pack_points()' raises ValueError outside it), and a pattern advanced packed must stay inside it
+#   The live cells are walked once, adding 1 to the count of each of their neighbours (only cells with a live neighbour get counted)
+#   'advance_packed()' works on sets of packed ints (pack once, step many times), 'advance_counted()' takes and returns points
+_PACK_BIAS = 1 << 31
+_PACK_MASK = (1 << 32) - 1
+_PACKED_OFFSETS = [ (dy << 32) + dx for (dy, dx) in _OFFSETS ]
+def pack_points(board):
+    for (x, y) in board:
+        if not (-_PACK_BIAS < x < _PACK_BIAS - 1 and -_PACK_BIAS < y < _PACK_BIAS - 1):
+            raise ValueError("point=(%s, %s) outside -2^31 < x, y < 2^31 - 1" % (x, y))
+    return set( ((y + _PACK_BIAS) << 32) | (x + _PACK_BIAS) for (x, y) in board )
+def unpack_points(packed):
+    return set( ((p & _PACK_MASK) - _PACK_BIAS, (p >> 32) - _PACK_BIAS) for p in packed )
+def advance_packed(packed):
+    counts = collections.Counter()
+    for offset in _PACKED_OFFSETS:
+        counts.update(map(offset.__add__, packed))
+    return set( p for (p, count) in counts.items() if count == 3 or (count == 2 and p in packed) )
+def advance_counted(board):
+    return unpack_points(advance_packed(pack_points(board)))
+
+def test_advance_packed():
+    #   {{{
+    glider = set( [ (0,0), (1,0), (2,0), (0,1), (1,2), ] )
+    board = glider | set( [ (-2**31 + 5, 2**31 - 6), (-2**31 + 6, 2**31 - 6), (-2**31 + 7, 2**31 - 6), ] )
+    packed = pack_points(board)
+    assert unpack_points(packed) == board
+    expected = board
+    for i in range(10):
+        packed = advance_packed(packed)
+        expected = advance(expected)
+        assert unpack_points(packed) == expected
+    assert advance_counted(expected) == advance(expected)
+    #   A blinker at the edge of the range (its neighbours are just inside it), and one past it
+    edge = 2**31 - 2
+    blinker = set( (edge, y) for y in (-1, 0, 1) )
+    assert advance_counted(blinker) == advance(blinker) == set( (x, 0) for x in (edge - 1, edge, edge + 1) )
+    for point in ((2**31 - 1, 0), (0, -2**31)):
+        try:
+            pack_points(set([ point ]))
+            assert False
+        except ValueError:
+            pass
+    #   }}}
+test_advance_packed()
+#   }}}
+
+
+#   Pattern files:
+#   {{{
+#   RLE ('x = 3, y = 3' header, then runs like '2bo$obo!', 'o' alive, 'b' dead, '$' end of row, the writer adds a '#R x y' corner) and plaintext '.cells' ('.' dead, 'O' alive)
+#   The readers are generators of points, so any engine built from an iterable of points is filled as the file is decoded
+#   (large files are memory-mapped and read a line at a time, gzip-compressed files are recognised by their magic number)
+_RLE_TOKEN = re.compile(r'(\d*)([^\d\s])')
+def _pattern_lines(path):
+    with open(path, 'rb') as f:
+        if f.read(2) == b'\x1f\x8b':
+            f.seek(0)
+            with gzip.open(f, 'rt') as g:
+                yield from g
+            return
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for line in iter(m.readline, b''):
+                yield line.decode()
+def parse_rle(lines):
+    #   ('#R x y' moves the top-left corner of the pattern from (0, 0) to (x, y))
+    x0, x, y = 0, 0, 0
+    for line in lines:
+        line = line.strip()
+        if line.startswith('#R'):
+            x0, y = [ int(v) for v in line[2:].split()[:2] ]
+            x = x0
+            continue
+        if line.startswith('#') or line.startswith('x'):
+            continue
+        for (count, tag) in _RLE_TOKEN.findall(line):
+            count = int(count) if count else 1
+            if tag == '!':
+                return
+            elif tag == '$':
+                x, y = x0, y + count
+            elif tag == 'b' or tag == '.':
+                x += count
+            else:
+                for i in range(count):
+                    yield (x + i, y)
+                x += count
+def parse_cells(lines):
+    y = 0
+    for line in lines:
+        if line.startswith('!'):
+            continue
+        for (x, c) in enumerate(line.rstrip()):
+            if c == 'O' or c == '*':
+                yield (x, y)
+        y += 1
+def read_rle(path):
+    return parse_rle(_pattern_lines(path))
+def read_cells(path):
+    return parse_cells(_pattern_lines(path))
+def _rle_rows(board):
+    #   Yield (y, sorted xs) for each row holding a live cell
+    for (y, points) in itertools.groupby(sorted(board, key=lambda p: (p[1], p[0])), key=lambda p: p[1]):
+        yield y, [ x for (x, _) in points ]
+def _rle_tokens(board):
+    min_x = min( x for (x, y) in board )
+    last_y = None
+    for (y, xs) in _rle_rows(board):
+        if last_y is not None:
+            yield '%s$' % (y - last_y if y - last_y > 1 else '')
+        last_y = y
+        runs = [ ('b', xs[0] - min_x) ] if xs[0] > min_x else []
+        for (alive, run) in itertools.groupby(range(xs[0], xs[-1] + 1), key=set(xs).__contains__):
+            runs.append(('o' if alive else 'b', len(list(run))))
+        for (tag, n) in runs:
+            yield '%s%s' % (n if n > 1 else '', tag)
+    yield '!'
+def write_rle(f, board, rule='B3/S23', comments=()):
+    #   'f' is a text file (wrap with 'gzip.open(path, 'wt')' to compress)
+    for comment in comments:
+        f.write('#C %s\n' % comment)
+    if len(board) == 0:
+        f.write('x = 0, y = 0, rule = %s\n!\n' % rule)
+        return
+    min_x, max_x = min( x for (x, y) in board ), max( x for (x, y) in board )
+    min_y, max_y = min( y for (x, y) in board ), max( y for (x, y) in board )
+    f.write('#R %d %d\n' % (min_x, min_y))
+    f.write('x = %d, y = %d, rule = %s\n' % (max_x - min_x + 1, max_y - min_y + 1, rule))
+    line = ''
+    for token in _rle_tokens(board):
+        if len(line) + len(token) > 70:
+            f.write(line + '\n')
+            line = ''
+        line += token
+    f.write(line + '\n')
+def write_cells(f, board):
+    if len(board) == 0:
+        return
+    min_x = min( x for (x, y) in board )
+    last_y = None
+    for (y, xs) in _rle_rows(board):
+        if last_y is not None:
+            f.write('\n' * (y - last_y - 1))
+        last_y = y
+        row = [ '.' ] * (xs[-1] - min_x + 1)
+        for x in xs:
+            row[x - min_x] = 'O'
+        f.write(''.join(row) + '\n')
+
+#   Checkpoints: every 'every' generations the board is written as a gzip-compressed RLE, with its generation in a '#C' comment
+#   (written to a temporary file and renamed, so a crash leaves the previous checkpoint intact)
+def write_checkpoint(path, board, generation):
+    tmp = path + '.tmp'
+    with gzip.open(tmp, 'wt') as f:
+        write_rle(f, board, comments=[ 'generation %d' % generation ])
+    os.replace(tmp, path)
+def read_checkpoint(path):
+    generation = 0
+    lines = _pattern_lines(path)
+    header = []
+    for line in lines:
+        header.append(line)
+        if line.startswith('#C generation'):
+            generation = int(line.split()[2])
+        if not line.startswith('#'):
+            break
+    return set(parse_rle(itertools.chain(header, lines))), generation
+def run_checkpointed(board, generations, path, every=1000, start=0):
+    #   (to resume: 'board, generation = read_checkpoint(path)', then 'run_checkpointed(board, generations, path, every, start=generation)')
+    for generation in range(start + 1, generations + 1):
+        board = advance(board)
+        if generation % every == 0:
+            write_checkpoint(path, board, generation)
+    return board
+
+def test_pattern_files():
+    #   {{{
+    gun = '#N Gosper glider gun\nx = 36, y = 9, rule = B3/S23\n24bo$22bobo$12b2o6b2o12b2o$11bo3bo4b2o12b2o$2o8bo5bo3b2o$2o8bo3bob2o4b\nobo$10bo5bo7bo$11bo3bo$12b2o!\n'
+    gun = set(parse_rle(gun.splitlines()))
+    assert len(gun) == 36 and (0, 4) in gun and (35, 3) in gun
+    with tempfile.TemporaryDirectory() as tmp:
+        board = gun | set( [ (-40, 100), (-39, 100), (-38, 100), ] )
+        path = os.path.join(tmp, 'gun.rle')
+        with open(path, 'w') as f:
+            write_rle(f, board)
+        assert set(read_rle(path)) == board
+        path = os.path.join(tmp, 'gun.cells')
+        with open(path, 'w') as f:
+            f.write('!Name: Gosper glider gun\n')
+            write_cells(f, gun)
+        assert set(read_cells(path)) == gun
+        #   A run interrupted after its last checkpoint resumes to the same board
+        path = os.path.join(tmp, 'run.rle.gz')
+        expected = run_checkpointed(gun, 50, path, every=20)
+        board, generation = read_checkpoint(path)
+        assert generation == 40
+        assert run_checkpointed(board, 50, path, every=20, start=generation) == expected
+    #   }}}
+test_pattern_files()
+#   }}}
+
+
+#   Instrumentation:
+#   {{{
+#   'run_instrumented()' advances with 'step_active()' and passes a 'GenerationStats' to 'hook' after every generation
+#   ('hook' is any callable, eg: 'collections.deque(maxlen=1024).append' keeps the latest generations in a ring buffer)
+#   The bounding box comes from per-row/column counts updated with the births and deaths, and is kept as running extrema:
+#   births widen it, and only a death that empties the outermost row/column rescans the counts for that side,
+#   'allocated' is the change in traced memory when 'tracemalloc' is tracing (and None otherwise)
+GenerationStats = collections.namedtuple('GenerationStats', [ 'generation', 'population', 'bbox', 'evaluated', 'seconds', 'allocated', ])
+def run_instrumented(board, generations, hook):
+    board = set(board)
+    active = set(board)
+    xs = collections.Counter( x for (x, y) in board )
+    ys = collections.Counter( y for (x, y) in board )
+    bbox = (min(xs), min(ys), max(xs), max(ys)) if len(board) > 0 else None
+    for generation in range(1, generations + 1):
+        tracing = tracemalloc.is_tracing()
+        before = tracemalloc.get_traced_memory()[0] if tracing else None
+        start = time.perf_counter()
+        births, deaths, evaluated = step_active(board, active)
+        seconds = time.perf_counter() - start
+        allocated = tracemalloc.get_traced_memory()[0] - before if tracing else None
+        active = births | deaths
+        xs.update( x for (x, y) in births )
+        ys.update( y for (x, y) in births )
+        xs.subtract( x for (x, y) in deaths )
+        ys.subtract( y for (x, y) in deaths )
+        for (x, y) in deaths:
+            if xs.get(x) == 0:
+                del xs[x]
+            if ys.get(y) == 0:
+                del ys[y]
+        if len(board) == 0:
+            bbox = None
+        else:
+            min_x, min_y, max_x, max_y = bbox
+            for (x, y) in births:
+                min_x, min_y, max_x, max_y = min(min_x, x), min(min_y, y), max(max_x, x), max(max_y, y)
+            min_x = min_x if min_x in xs else min(xs)
+            min_y = min_y if min_y in ys else min(ys)
+            max_x = max_x if max_x in xs else max(xs)
+            max_y = max_y if max_y in ys else max(ys)
+            bbox = (min_x, min_y, max_x, max_y)
+        hook(GenerationStats(generation, len(board), bbox, evaluated, seconds, allocated))
+    return board
+
+def test_run_instrumented():
+    #   {{{
+    glider = set( [ (0,0), (1,0), (2,0), (0,1), (1,2), ] )
+    ring = collections.deque(maxlen=4)
+    board = run_instrumented(glider, 10, ring.append)
+    assert board == advance_many(glider, 10)[0]
+    assert [ stats.generation for stats in ring ] == [ 7, 8, 9, 10 ]
+    assert ring[-1].population == 5 and ring[-1].bbox == (-2, -3, 0, -1)
+    assert ring[-1].evaluated > 0 and ring[-1].seconds >= 0 and ring[-1].allocated is None
+    tracemalloc.start()
+    run_instrumented(glider, 1, ring.append)
+    tracemalloc.stop()
+    assert ring[-1].allocated is not None
+    assert run_instrumented(set( [ (0,0), ] ), 1, ring.append) == set() and ring[-1].bbox is None
+    #   The bounding box follows both gliders as each edge row/column empties
+    pair = glider | set( (x + 20, y + 20) for (x, y) in glider )
+    run_instrumented(pair, 12, ring.append)
+    expected = advance_many(pair, 12)[0]
+    assert ring[-1].bbox == (min( x for (x, y) in expected ), min( y for (x, y) in expected ), max( x for (x, y) in expected ), max( y for (x, y) in expected ))
+    #   }}}
+test_run_instrumented()
+#   }}}
+
+
+#   Benchmarks:
+#   {{{
+#   'python stop-writing-classes.py --benchmark' runs every engine against a fixed corpus (a glider, the Gosper gun, methuselahs,
+#   and random soups at 10/30/50% density), each placed in a square region of 10^2 up to '--max-cells' cells
+#   It reports generations per second and peak (traced) memory per run, and how time per generation scales with the region
+#   Each run is '--generations' from the pattern, timed as 'timeit' does: repeated until a measurement takes at least '--min-time',
+#   and the best of '--repeat' measurements kept (a run whose measurement takes more than '--budget' is measured once)
+#   With '--baseline', a run slower than the stored generations per second (by more than '--tolerance') fails the benchmark,
+#   '--update-baseline' stores the current results instead (runs measured for less than 'min_seconds' are too noisy to compare,
+#   and the tolerance for each run is widened by how much its own measurements varied)
+_CORPUS = {
+    'glider': 'bo$2bo$3o!',
+    'gun': '24bo$22bobo$12b2o6b2o12b2o$11bo3bo4b2o12b2o$2o8bo5bo3b2o$2o8bo3bob2o4bobo$10bo5bo7bo$11bo3bo$12b2o!',
+    'r-pentomino': 'b2o$2o$bo!',
+    'acorn': 'bo$3bo$2o2b3o!',
+    'diehard': '6bo$2o$bo3b3o!',
+}
+_SOUPS = { 'soup-10': 0.1, 'soup-30': 0.3, 'soup-50': 0.5, }
+def _corpus_board(family, side):
+    if family in _SOUPS:
+        rng = random.Random(side)
+        density = _SOUPS[family]
+        return set( (x, y) for x in range(side) for y in range(side) if rng.random() < density )
+    pattern = set(parse_rle([ _CORPUS[family] ]))
+    return set( (x + side // 2, y + side // 2) for (x, y) in pattern )
+def _engines(side):
+    #   name -> (prepare(points, side), step(state, generations)), only the engines whose dependencies are available
+    def repeat(step):
+        def run(state, generations):
+            for i in range(generations):
+                state = step(state)
+            return state
+        return run
+    def board_step(board):
+        board.advance()
+        return board
+    def active_step(state):
+        board, active = state
+        births, deaths, evaluated = step_active(board, active)
+        return board, births | deaths
+    def hashlife_step(life, generations):
+        life.advance_by(generations)
+        return life
+    engines = {
+        'Board': (lambda points: Board(points), repeat(board_step)),
+        'advance': (lambda points: points, repeat(advance)),
+        'advance_packed': (pack_points, repeat(advance_packed)),
+        'step_active': (lambda points: (set(points), set(points)), repeat(active_step)),
+        'HashLife': (HashLife, hashlife_step),
+    }
+    if np is not None:
+        engines.update({
+            'advance_grid': (lambda points: to_grid(points, (max([ side ] + [ max(p) + 1 for p in points ]),) * 2), repeat(advance_grid)),
+            'BitBoard': (to_bitboard, repeat(advance)),
+            'ChunkWorld': (ChunkWorld, repeat(advance)),
+        })
+    return engines
+def _time_run(prepare, step, points, generations, min_time=0.2, loops=1):
+    #   Seconds per run from a measurement of at least 'min_time' (doubling 'loops' until it is), and the 'loops' used
+    while True:
+        seconds = 0.0
+        for i in range(loops):
+            state = prepare(points)
+            start = time.perf_counter()
+            step(state, generations)
+            seconds += time.perf_counter() - start
+        if seconds >= min_time:
+            return seconds / loops, loops
+        loops *= 2
+def run_benchmarks(max_cells=10**5, generations=20, budget=2.0, min_time=0.2, repeat=5):
+    #   Each round measures every run once, and the best of 'repeat' rounds is kept: spreading a run's measurements over the whole
+    #   benchmark (rather than taking them back to back) keeps a slow spell of the machine from spoiling all of them
+    sizes = [ 10**e for e in range(2, 8) if 10**e <= max_cells ]
+    measured = dict()
+    for r in range(repeat):
+        for size in sizes:
+            side = math.isqrt(size)
+            for family in list(_CORPUS) + list(_SOUPS):
+                points = _corpus_board(family, side)
+                for (engine, (prepare, step)) in _engines(side).items():
+                    times, loops = measured.get((engine, family, size), ([], 1))
+                    if r > 0 and min(times) * loops >= budget:
+                        continue
+                    seconds, loops = _time_run(prepare, step, points, generations, min_time, loops)
+                    measured[engine, family, size] = (times + [ seconds ], loops)
+    results = []
+    for size in sizes:
+        side = math.isqrt(size)
+        for family in list(_CORPUS) + list(_SOUPS):
+            points = _corpus_board(family, side)
+            for (engine, (prepare, step)) in _engines(side).items():
+                times, loops = measured[engine, family, size]
+                seconds = min(times)
+                tracemalloc.start()
+                step(prepare(points), 1)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                results.append({ 'engine': engine, 'family': family, 'size': size, 'generations': generations,
+                                 'gens_per_s': generations / seconds if seconds > 0 else float('inf'), 'peak_bytes': peak,
+                                 'seconds': seconds * loops, 'spread': max(times) / seconds if seconds > 0 else 1.0, })
+                print('%-14s %-12s %9d cells %10.1f gen/s %12d bytes' % (engine, family, size, results[-1]['gens_per_s'], peak))
+    return results
+def scaling(results):
+    #   Slope of log(seconds per generation) against log(cells), per engine and family (1.0 is linear in the region size)
+    curves = collections.defaultdict(list)
+    for r in results:
+        curves[r['engine'], r['family']].append((math.log(r['size']), -math.log(r['gens_per_s'])))
+    slopes = dict()
+    for (key, points) in curves.items():
+        if len(points) < 2:
+            continue
+        mean_x = sum( x for (x, y) in points ) / len(points)
+        mean_y = sum( y for (x, y) in points ) / len(points)
+        slopes[key] = sum( (x - mean_x) * (y - mean_y) for (x, y) in points ) / sum( (x - mean_x) ** 2 for (x, y) in points )
+    return slopes
+def regressions(results, baseline, tolerance=0.25, min_seconds=0.05):
+    #   Only runs measured for at least 'min_seconds', both now and in the baseline, are compared, and the tolerance is widened
+    #   by the larger 'spread' (slowest over fastest of its measurements) of the two, so a run as noisy as the slowdown isn't flagged
+    expected = { (b['engine'], b['family'], b['size']): b for b in baseline if b.get('seconds', 0) >= min_seconds }
+    slower = []
+    for r in results:
+        b = expected.get((r['engine'], r['family'], r['size']))
+        if b is None or r.get('seconds', 0) < min_seconds:
+            continue
+        if r['gens_per_s'] < b['gens_per_s'] * (1 - tolerance) / max(r.get('spread', 1.0), b.get('spread', 1.0)):
+            slower.append(r)
+    return slower
+def benchmark(argv):
+    parser = argparse.ArgumentParser(description='Game of Life engine benchmarks')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--max-cells', type=int, default=10**5)
+    parser.add_argument('--generations', type=int, default=20)
+    parser.add_argument('--budget', type=float, default=2.0, help='seconds per engine/pattern/size')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per measurement')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default=None, help='json file of a previous run')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+    results = run_benchmarks(args.max_cells, args.generations, args.budget, args.min_time, args.repeat)
+    print()
+    for ((engine, family), slope) in sorted(scaling(results).items()):
+        print('%-14s %-12s time/generation ~ cells^%.2f' % (engine, family, slope))
+    if args.baseline is None:
+        return 0
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        return 0
+    with open(args.baseline) as f:
+        slower = regressions(results, json.load(f), args.tolerance)
+    for r in slower:
+        print('regression: %s %s %d cells, %.1f gen/s' % (r['engine'], r['family'], r['size'], r['gens_per_s']), file=sys.stderr)
+    return 1 if len(slower) > 0 else 0
+
+def test_benchmark():
+    #   {{{
+    results = [ { 'engine': 'advance', 'family': 'glider', 'size': 100, 'gens_per_s': 50.0, 'seconds': 0.2, },
+                { 'engine': 'advance', 'family': 'glider', 'size': 10000, 'gens_per_s': 49.0, 'seconds': 0.2, } ]
+    baseline = [ dict(r, gens_per_s=100.0) for r in results ]
+    assert regressions(results, baseline) == results
+    assert regressions(results, baseline, tolerance=0.6) == []
+    #   A noisy run is given more tolerance, and a run measured too briefly (now, or in the baseline) isn't compared
+    assert regressions([ dict(results[0], spread=1.5) ], baseline) == []
+    assert regressions([ dict(results[0], gens_per_s=40.0, spread=1.5) ], baseline) == [ dict(results[0], gens_per_s=40.0, spread=1.5) ]
+    assert regressions([ dict(results[0], seconds=0.001) ], baseline) == []
+    assert regressions(results, [ dict(baseline[0], seconds=0.001) ]) == []
+    #   A fast run is repeated until a measurement takes 'min_time'
+    prepare, step = _engines(10)['advance']
+    seconds, loops = _time_run(prepare, step, _corpus_board('glider', 10), 2, min_time=0.01)
+    assert loops > 1 and seconds * loops >= 0.01
+    assert abs(scaling(results)[('advance', 'glider')]) < 0.01
+    assert len(_corpus_board('acorn', 10)) == 7 and len(_corpus_board('gun', 10)) == 36
+    #   }}}
+test_benchmark()
+#   }}}
+
+
+#   Frame streaming: (asyncio)
+#   {{{
+#   One 'LifeServer' runs the simulation and broadcasts each generation to every connected socket client
+#   A frame is encoded once and shared by every subscriber: a delta frame (births, deaths), or a keyframe (every live cell),
+#   each a header ('D' or 'K', generation, payload length) and a zlib-compressed payload of int32 coordinates
+#   Every client has a bounded queue: when it is full the frame is dropped for that client, which is sent a keyframe
+#   (encoded at most once per generation) as soon as it has room again, so a slow client never makes the server buffer without bound
+_FRAME_HEADER = struct.Struct('!cII')
+def encode_frame(kind, generation, *point_sets):
+    payload = bytearray()
+    for points in point_sets:
+        payload += struct.pack('!I', len(points))
+        payload += struct.pack('!%di' % (2 * len(points)), *itertools.chain(*points))
+    payload = zlib.compress(payload, 1)
+    return _FRAME_HEADER.pack(kind, generation, len(payload)) + payload
+async def read_frame(reader):
+    kind, generation, length = _FRAME_HEADER.unpack(await reader.readexactly(_FRAME_HEADER.size))
+    payload = zlib.decompress(await reader.readexactly(length))
+    point_sets, offset = [], 0
+    while offset < len(payload):
+        (n,) = struct.unpack_from('!I', payload, offset)
+        values = struct.unpack_from('!%di' % (2 * n), payload, offset + 4)
+        point_sets.append(set(zip(values[0::2], values[1::2])))
+        offset += 4 + 8 * n
+    return kind, generation, point_sets
+class LifeServer:
+    def __init__(self, board, interval=0.05, queue_size=8):
+        self.board = set(board)
+        self.generation = 0
+        self.interval = interval
+        self.queue_size = queue_size
+        self.clients = dict()
+        self._handlers = set()
+        self._closing = False
+    async def serve(self, host='127.0.0.1', port=0):
+        return await asyncio.start_server(self._handle, host, port)
+    async def run(self, generations=None):
+        active = set(self.board)
+        while generations is None or self.generation < generations:
+            births, deaths, evaluated = step_active(self.board, active)
+            active = births | deaths
+            self.generation += 1
+            self._broadcast(births, deaths)
+            await asyncio.sleep(self.interval)
+    def _broadcast(self, births, deaths):
+        delta = encode_frame(b'D', self.generation, births, deaths)
+        keyframe = None
+        #   'self.clients' maps each client queue to whether it has missed a frame (new clients start out needing a keyframe)
+        for (queue, stale) in self.clients.items():
+            if queue.full():
+                self.clients[queue] = True
+                continue
+            if stale and keyframe is None:
+                keyframe = encode_frame(b'K', self.generation, self.board)
+            queue.put_nowait(keyframe if stale else delta)
+            self.clients[queue] = False
+    async def close(self):
+        #   Disconnect every client once its queued frames are sent (no frame is dropped, so the stream stays consistent):
+        #   a client waiting on an empty queue is woken by a None, and one with a full queue stops when it has emptied it
+        self._closing = True
+        for queue in self.clients:
+            if not queue.full():
+                queue.put_nowait(None)
+        await asyncio.gather(*self._handlers)
+    async def _handle(self, reader, writer):
+        queue = asyncio.Queue(self.queue_size)
+        self.clients[queue] = True
+        self._handlers.add(asyncio.current_task())
+        try:
+            while (frame := await queue.get()) is not None:
+                writer.write(frame)
+                await writer.drain()
+                if self._closing and queue.empty():
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            del self.clients[queue]
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+def test_LifeServer():
+    #   {{{
+    glider = set( [ (0,0), (1,0), (2,0), (0,1), (1,2), ] )
+    expected = advance_many(glider, 20)[0]
+    async def client(port, generations):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        board = None
+        while True:
+            kind, generation, point_sets = await read_frame(reader)
+            if kind == b'K':
+                board = point_sets[0]
+            elif board is not None:
+                apply_delta(board, *point_sets)
+            if generation == generations:
+                writer.close()
+                return board
+    async def main():
+        server = LifeServer(glider, interval=0.001)
+        listener = await server.serve()
+        port = listener.sockets[0].getsockname()[1]
+        clients = [ asyncio.create_task(client(port, 20)) for i in range(3) ]
+        while len(server.clients) < 3:
+            await asyncio.sleep(0.001)
+        await server.run(20)
+        boards = await asyncio.gather(*clients)
+        await server.close()
+        listener.close()
+        await listener.wait_closed()
+        return boards
+    assert asyncio.run(main()) == [ expected ] * 3
+    #   A client that stops reading has frames dropped, and is resynchronised with a keyframe
+    server = LifeServer(glider, queue_size=2)
+    queue = asyncio.Queue(2)
+    server.clients[queue] = False
+    for i in range(4):
+        server._broadcast(set(), set())
+    assert queue.qsize() == 2 and server.clients[queue]
+    queue.get_nowait()
+    server._broadcast(set(), set())
+    assert _FRAME_HEADER.unpack(queue._queue[-1][:_FRAME_HEADER.size])[0] == b'K'
+    #   Closing with a full queue sends every queued frame (the keyframe, then the delta onto it) before disconnecting
+    async def close_full():
+        server = LifeServer(glider, queue_size=2)
+        listener = await server.serve()
+        reader, writer = await asyncio.open_connection('127.0.0.1', listener.sockets[0].getsockname()[1])
+        while len(server.clients) < 1:
+            await asyncio.sleep(0.001)
+        for i in range(2):
+            server.generation += 1
+            server._broadcast(set(), set())
+        await server.close()
+        frames = []
+        try:
+            while True:
+                kind, generation, point_sets = await read_frame(reader)
+                frames.append((kind, generation))
+        except asyncio.IncompleteReadError:
+            pass
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        return frames
+    assert asyncio.run(close_full()) == [ (b'K', 1), (b'D', 2) ]
+    #   }}}
+test_LifeServer()
+#   }}}
+
+if __name__ == '__main__' and '--benchmark' in sys.argv:
+    sys.exit(benchmark(sys.argv[1:]))